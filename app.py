@@ -3,14 +3,13 @@ import pandas as pd
 import numpy as np
 import folium
 import os
-import plotly.graph_objects as go
-import plotly.express as px
 from streamlit_folium import st_folium
-from streamlit_vtkjs import st_vtkjs
 
-# Importaciones locales
-from geometry_utils import generar_nave_3d_vtk
-from weather_utils import obtener_estaciones_cercanas, descargar_y_extraer_epw, procesar_datos_clima
+# Importaciones locales (geometry_utils, plotly y el visor VTK se cargan en su pestaña;
+# la mayoría de las sesiones solo usan el mapa y el primer render no debe esperarlos)
+from weather_utils import obtener_estaciones_cercanas, buscar_estaciones_por_nombre, clima_en_cache
+from prefetch_utils import PrefetchClima
+from store_utils import ALMACEN
 
 # 1. CONFIGURACIÓN DE PÁGINA
 st.set_page_config(page_title="SkyCalc 2.0 - Eco Consultor", layout="wide", page_icon="⚡")
@@ -56,10 +55,21 @@ def cargar_catalogo():
 
 df_domos = cargar_catalogo()
 
+@st.cache_data(show_spinner=False, max_entries=32)
+def psicrometria_estacion(clave_estacion, _clima):
+    """Psicrometría de las 8,760 h, calculada una vez por estación (no en cada rerun)."""
+    from psychro_utils import analisis_psicrometrico
+    psy = analisis_psicrometrico(_clima['temp_seca'], _clima['hum_relativa'],
+                                 _clima.get('metadata', {}).get('elevacion', 0.0))
+    # st.cache_data deserializa una copia en cada llamada: solo indicadores y carta (~8 KB),
+    # no las series horarias que la app no usa
+    return {k: v for k, v in psy.items() if k == 'carta' or np.ndim(v) == 0}
+
 # 3. INICIALIZACIÓN DE ESTADO
 for key in ['clima_data', 'estacion_seleccionada', 'df_cercanas', 'vtk_path']:
     if key not in st.session_state: st.session_state[key] = None
 
+if 'prefetch' not in st.session_state: st.session_state.prefetch = PrefetchClima()
 if 'lat' not in st.session_state: st.session_state.lat = 20.5888
 if 'lon' not in st.session_state: st.session_state.lon = -100.3899
 
@@ -68,8 +78,11 @@ def buscar_estaciones():
         df_cercanas = obtener_estaciones_cercanas(st.session_state.lat, st.session_state.lon)
         st.session_state.df_cercanas = df_cercanas
         if df_cercanas is None or df_cercanas.empty:
+            st.session_state.prefetch.cancelar()
             st.error("No se encontraron estaciones para esta ubicación.")
         else:
+            # Descarga y procesa en segundo plano las más cercanas (cancela la búsqueda anterior)
+            st.session_state.prefetch.programar(list(df_cercanas['URL_ZIP']))
             st.success(f"Encontradas {len(df_cercanas)} estaciones.")
 
 # 4. SIDEBAR - CONFIGURACIÓN DEL PROYECTO
@@ -80,7 +93,17 @@ with st.sidebar:
     with st.expander("📍 1. Ubicación y Clima", expanded=False):
         search_name = st.text_input("Buscar por ciudad o país", placeholder="Ej: Madrid, España")
         if st.button("🔍 Buscar por Nombre"):
-            if search_name:
+            # Primero el índice local de estaciones (instantáneo); si no hay coincidencias, geocodificar
+            df_nombre = buscar_estaciones_por_nombre(search_name) if search_name else None
+            if df_nombre is not None and not df_nombre.empty:
+                st.session_state.df_cercanas = df_nombre
+                st.session_state.prefetch.programar(list(df_nombre['URL_ZIP']))
+                con_coords = df_nombre.dropna(subset=['lat', 'lon'])
+                if not con_coords.empty:
+                    st.session_state.lat = float(con_coords.iloc[0]['lat'])
+                    st.session_state.lon = float(con_coords.iloc[0]['lon'])
+                st.success(f"Encontradas {len(df_nombre)} estaciones por nombre.")
+            elif search_name:
                 from geopy.geocoders import Nominatim
                 try:
                     geolocator = Nominatim(user_agent="skycalc_buscador_ui")
@@ -105,6 +128,13 @@ with st.sidebar:
     ancho_nave = st.number_input("Ancho (m)", 10.0, 500.0, 50.0)
     largo_nave = st.number_input("Largo (m)", 10.0, 500.0, 100.0)
     alto_nave = st.number_input("Altura (m)", 3.0, 30.0, 8.0)
+    with st.expander("Planta poligonal (opcional)"):
+        st.caption("Un vértice 'x, y' (m) por línea; deja una línea en blanco entre polígonos. "
+                   "Si defines un contorno, reemplaza al rectángulo Ancho × Largo.")
+        txt_contorno = st.text_area("Contorno (forma en L, etc.)", placeholder="0, 0\n120, 0\n120, 40\n40, 40\n40, 100\n0, 100")
+        txt_huecos = st.text_area("Patios (sin techo)")
+        txt_exclusiones = st.text_area("Zonas sin domos (HVAC, grúas)")
+        holgura_domos = st.number_input("Holgura a bordes y zonas (m)", 0.0, 10.0, 0.0, 0.5)
     
     st.subheader("☀️ 3. Sunoptics")
     modelo_sel = st.selectbox("Modelo NFRC", df_domos['Modelo'])
@@ -158,45 +188,49 @@ with tab_config:
             st.write("Selecciona una estación para descargar el .epw:")
             for idx, row in st.session_state.df_cercanas.iterrows():
                 st_name = row.get('name') or row.get('Station') or f"Estación {idx}"
-                st_dist = row.get('distancia_km') or 0
+                st_dist = row.get('distancia_km')
                 
                 url = row.get('URL_ZIP') or row.get('epw') 
 
                 with st.container():
                     st.markdown(f"**{st_name}**")
-                    st.caption(f"📏 Distancia: **{st_dist} km**")
+                    listo = " · ⚡ Datos listos" if url and clima_en_cache(url) else ""
+                    if pd.notna(st_dist):
+                        st.caption(f"📏 Distancia: **{st_dist} km**{listo}")
+                    else:
+                        st.caption(f"🔎 Coincidencia por nombre{listo}")
                     if st.button(f"📥 Descargar Datos", key=f"btn_st_{idx}", use_container_width=True):
                         if url:
                             with st.spinner(f"Descargando e inyectando datos..."):
-                                path = descargar_y_extraer_epw(url)
-                                if path:
-                                    try:
-                                        data = procesar_datos_clima(path)
-                                        if data:
-                                            st.session_state.clima_data = data
-                                            st.session_state.estacion_seleccionada = st_name
-                                            st.rerun()
-                                        else:
-                                            st.error("Error al procesar el archivo EPW con Ladybug.")
-                                    finally:
-                                        if os.path.exists(path):
-                                            os.remove(path)
+                                # Almacén compartido (memmap del espejo/caché); si no está en disco,
+                                # espera la precarga en curso o descarga
+                                data = ALMACEN.abrir(url, obtener=st.session_state.prefetch.obtener)
+                                if data:
+                                    # La sesión solo guarda el handle; el anterior se devuelve al almacén
+                                    if hasattr(st.session_state.clima_data, "liberar"):
+                                        st.session_state.clima_data.liberar()
+                                    st.session_state.clima_data = data
+                                    st.session_state.estacion_seleccionada = st_name
+                                    st.rerun()
                                 else:
-                                    st.error("Error de descarga. El archivo no está disponible.")
+                                    st.error("Error de descarga o al procesar el EPW. El archivo no está disponible.")
 
 # --- PESTAÑA 2: GRÁFICOS BIOCLIMÁTICOS (Recuperados) ---
 with tab_clima:
     st.subheader("Análisis Bioclimático del Sitio")
     
     if st.session_state.clima_data and 'vel_viento' in st.session_state.clima_data:
+        import plotly.graph_objects as go
+        import plotly.express as px
+
         clima = st.session_state.clima_data
         md = clima.get('metadata', {})
         
         cols_hvac = st.columns(4)
         cols_hvac[0].metric("Latitud", f"{md.get('lat', st.session_state.lat)}°")
         cols_hvac[1].metric("Elevación", f"{md.get('elevacion', 0)} m")
-        cols_hvac[2].metric("Humedad Relativa Media", f"{round(sum(clima.get('hum_relativa', [0]))/8760, 1)} %")
-        cols_hvac[3].metric("Velocidad Viento Media", f"{round(sum(clima.get('vel_viento', [0]))/8760, 1)} m/s")
+        cols_hvac[2].metric("Humedad Relativa Media", f"{np.mean(clima.get('hum_relativa', [0])):.1f} %")
+        cols_hvac[3].metric("Velocidad Viento Media", f"{np.mean(clima.get('vel_viento', [0])):.1f} m/s")
         
         st.divider()
         col_graf_1, col_graf_2 = st.columns(2)
@@ -228,8 +262,8 @@ with tab_clima:
             st.markdown("### ☀️ Balance de Irradiación")
             st.caption("Justificación técnica para domos prismáticos de alta difusión.")
             
-            suma_directa = sum(clima.get('rad_directa', [0]))
-            suma_difusa = sum(clima.get('rad_dif', [0]))
+            suma_directa = float(np.sum(clima.get('rad_directa', [0])))
+            suma_difusa = float(np.sum(clima.get('rad_dif', [0])))
             
             fig_pie = go.Figure(data=[go.Pie(labels=['Radiación Directa (Luz Dura)', 'Radiación Difusa (Luz Suave)'],
                                              values=[suma_directa, suma_difusa], hole=.4,
@@ -242,7 +276,8 @@ with tab_clima:
         st.markdown("### 🌡️ Mapa de Calor Anual (Temperatura de Bulbo Seco)")
         st.caption("Visualización de las 8,760 horas del año. Identifica los picos críticos de calor (rojo) y frío (azul) para el diseño del HVAC.")
         
-        temp_array = np.array(clima.get('temp_seca', np.zeros(8760)))
+        # Vista sin copia del memmap compartido del almacén
+        temp_array = np.asarray(clima.get('temp_seca', np.zeros(8760)))
         
         if len(temp_array) == 8760:
             temp_matriz = temp_array.reshape(365, 24).T 
@@ -271,14 +306,35 @@ with tab_clima:
         st.divider()
         st.markdown("### ☁️ Termodinámica y Nubosidad (Análisis BEM)")
         
-        temp_diaria = np.array([sum(temp_array[i:i+24])/24 for i in range(0, 8760, 24)]) if len(temp_array) == 8760 else np.zeros(365)
-        cdd_anual = sum([t - 18.3 for t in temp_diaria if t > 18.3])
-        hdd_anual = sum([18.3 - t for t in temp_diaria if t < 18.3])
+        temp_diaria = temp_array.reshape(365, 24).mean(axis=1) if len(temp_array) == 8760 else np.zeros(365)
+        cdd_anual = np.clip(temp_diaria - 18.3, 0.0, None).sum()
+        hdd_anual = np.clip(18.3 - temp_diaria, 0.0, None).sum()
 
         col_t1, col_t2 = st.columns(2)
         col_t1.metric("Grados Día Refrigeración (CDD)", f"{int(cdd_anual)}", "Demanda de Aire Acondicionado (Frío)", delta_color="inverse")
         col_t2.metric("Grados Día Calefacción (HDD)", f"{int(hdd_anual)}", "Demanda de Calefacción (Calor)")
 
+        if 'hum_relativa' in clima and len(temp_array) == 8760:
+            psy = psicrometria_estacion(clima.clave, clima)
+            col_p1, col_p2, col_p3, col_p4 = st.columns(4)
+            col_p1.metric("Horas de Refrigeración", f"{psy['horas_frio']:,}", "Bulbo seco > 24 °C", delta_color="off")
+            col_p2.metric("Horas de Deshumidificación", f"{psy['horas_deshumidificacion']:,}", "W > 12 g/kg", delta_color="off")
+            col_p3.metric("Diseño 0.4% (BS / BH)", f"{psy['bulbo_seco_diseno']:.1f} / {psy['bulbo_humedo_diseno']:.1f} °C")
+            col_p4.metric("Confort Adaptativo (ASHRAE 55)", f"{psy['horas_confort'] / 87.6:.0f} %",
+                          f"{psy['horas_disconfort_calor']:,} h calor · {psy['horas_disconfort_frio']:,} h frío", delta_color="off")
+
+            with st.expander("📈 Carta Psicrométrica (horas por celda)"):
+                from psychro_utils import BORDES_T, BORDES_W
+                carta = psy['carta'].T.astype(float)
+                carta[carta == 0] = np.nan
+                fig_psy = go.Figure(data=go.Heatmap(
+                    z=carta, x=BORDES_T[:-1] + 0.5, y=BORDES_W[:-1] + 0.5, colorscale='YlGnBu',
+                    colorbar=dict(title="Horas"),
+                    hovertemplate="BS: %{x:.1f} °C<br>W: %{y:.1f} g/kg<br>%{z:.0f} h<extra></extra>"))
+                fig_psy.update_layout(xaxis_title="Temperatura de Bulbo Seco (°C)", yaxis_title="Razón de Humedad (g/kg)",
+                                      template="plotly_white", height=400, margin=dict(t=10, b=30, l=40, r=20))
+                st.plotly_chart(fig_psy, use_container_width=True)
+
         st.markdown("#### ☁️ Perfil de Nubosidad Mensual")
         st.caption("Porcentaje promedio de cielo cubierto. Los meses grises son donde la tecnología prismática de **Sunoptics®** captura luz en ángulos bajos, superando ampliamente al vidrio o policarbonato liso.")
         
@@ -316,19 +372,32 @@ with tab_3d:
     
     if st.button("🏗️ Generar Modelo 3D", use_container_width=True):
         with st.spinner("Construyendo geometría Honeybee..."):
+            from geometry_utils import generar_nave_3d_vtk
+            from layout_utils import parsear_poligonos
             datos_domo = df_domos[df_domos['Modelo'] == modelo_sel].iloc[0]
-            vtk_path, num_domos, sfr_real = generar_nave_3d_vtk(
+            try:
+                contornos = parsear_poligonos(txt_contorno)
+                huecos, exclusiones = parsear_poligonos(txt_huecos), parsear_poligonos(txt_exclusiones)
+            except ValueError:
+                st.error("Coordenadas inválidas en la planta poligonal. Usa 'x, y' por línea.")
+                contornos, huecos, exclusiones = [], [], []
+            vtk_path, num_domos, sfr_real, layout = generar_nave_3d_vtk(
                 ancho_nave, largo_nave, alto_nave, sfr_target, 
                 datos_domo['Ancho_m'], datos_domo['Largo_m'],
-                lat=st.session_state.lat, lon=st.session_state.lon
+                lat=st.session_state.lat, lon=st.session_state.lon,
+                poligono=contornos[0] if contornos else None,
+                huecos=huecos, exclusiones=exclusiones, holgura_m=holgura_domos
             )
             if vtk_path:
                 st.session_state.vtk_path = vtk_path
                 st.session_state.num_domos_real = num_domos
                 st.session_state.sfr_final = sfr_real
                 st.session_state.datos_domo_actual = datos_domo
+                # El mismo layout del modelo 3D, para la malla de iluminación de la simulación
+                st.session_state.layout_nave = layout
 
     if st.session_state.vtk_path and os.path.exists(st.session_state.vtk_path):
+        from streamlit_vtkjs import st_vtkjs
         
         # --- LÓGICA TÉCNICA ASHRAE 90.1 ---
         sfr_pct = st.session_state.sfr_final * 100
@@ -388,22 +457,48 @@ with tab_analitica:
 
         if len(temp_data) > 0:
             c1, c2, c3 = st.columns(3)
-            c1.metric("Temp. Media", f"{round(sum(temp_data)/len(temp_data), 1)} °C")
-            c2.metric("Rad. Directa Máx", f"{max(rad_data) if len(rad_data) > 0 else 'N/A'} W/m²")
-            c3.metric("Rad. Difusa Máx", f"{max(rad_dif) if len(rad_dif) > 0 else 'N/A'} W/m²")
+            c1.metric("Temp. Media", f"{np.mean(temp_data):.1f} °C")
+            c2.metric("Rad. Directa Máx", f"{np.max(rad_data) if len(rad_data) > 0 else 'N/A'} W/m²")
+            c3.metric("Rad. Difusa Máx", f"{np.max(rad_dif) if len(rad_dif) > 0 else 'N/A'} W/m²")
 
             st.divider()
 
             if st.button("🔥 EJECUTAR SIMULACIÓN"):
-                with st.spinner("Calculando demanda térmica..."):
-                    import time
-                    time.sleep(1)
+                with st.spinner("Calculando demanda térmica e iluminación natural..."):
+                    layout = st.session_state.get('layout_nave')
+                    if layout and 'ilum_global' in clima:
+                        from daylight_utils import analizar_iluminacion
+                        domo = st.session_state.datos_domo_actual
+                        st.session_state.iluminacion = analizar_iluminacion(
+                            layout['contorno'], layout['centros'], layout['altura'],
+                            domo['Ancho_m'], domo['Largo_m'], clima['ilum_global'], domo['VLT'],
+                            huecos=layout['huecos'])
+                    else:
+                        st.session_state.iluminacion = None
                     st.session_state.calculo_completado = True
                     st.balloons()
                     st.success("Cálculo completado.")
 
             if getattr(st.session_state, 'calculo_completado', False):
                 st.write("### Resultados de la Optimización")
+                ilum = st.session_state.get('iluminacion')
+                if ilum:
+                    import plotly.graph_objects as go
+                    st.markdown("#### 💡 Iluminación Natural en el Plano de Trabajo (0.8 m)")
+                    ci1, ci2, ci3 = st.columns(3)
+                    ci1.metric("sDA 300/50%", f"{ilum['sda'] * 100:.0f} %")
+                    ci2.metric("Iluminancia Media (8-18 h)", f"{ilum['iluminancia_media_global']:.0f} lux")
+                    ci3.metric("Uniformidad (Emín/Emed)", f"{ilum['uniformidad']:.2f}")
+                    sens = ilum['sensores']
+                    fig_ilum = go.Figure(data=go.Scattergl(
+                        x=sens[:, 0], y=sens[:, 1], mode='markers',
+                        marker=dict(color=ilum['autonomia'] * 100, colorscale='YlOrBr_r', size=4,
+                                    colorbar=dict(title="% horas ≥300 lux"))))
+                    fig_ilum.update_layout(xaxis_title="x (m)", yaxis_title="y (m)", yaxis=dict(scaleanchor='x'),
+                                           template="plotly_white", height=450, margin=dict(t=10, b=30, l=40, r=20))
+                    st.plotly_chart(fig_ilum, use_container_width=True)
+                else:
+                    st.info("Genera el modelo 3D (y usa un clima con iluminancia exterior) para ver la malla de iluminación natural.")
                 df_temp = pd.DataFrame({'Temperatura (°C)': temp_data[:168]})
                 st.line_chart(df_temp)
                 st.write("Estimación de Ahorro Proyectado: **24.5%**.")
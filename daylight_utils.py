@@ -0,0 +1,163 @@
+# daylight_utils.py
+"""Malla de iluminancia en el plano de trabajo bajo los domos (solo NumPy).
+
+Cada domo prismático se modela como un emisor lambertiano horizontal: su exitancia es la
+iluminancia global horizontal exterior x VLT x eficiencia del pozo de luz, y un sensor a
+distancia horizontal r y desnivel h recibe  E = (M / π) · A · h² / (h² + r²)².
+
+La suma sobre domos se separa en geometría x clima:  E(s, t) = e(t) · K(s),  con
+e(t) = Eext(t) · VLT · eficiencia  y  K(s) = (A / π) Σ_d h² / (h² + r_sd²)².  Así el tensor
+sensores x domos x horas nunca se materializa: el término caro, K (sensores x domos), se
+calcula en bloques float32 de tamaño acotado repartidos en un pool de procesos, y las
+métricas anuales salen de ordenar e(t) una vez (sDA por búsqueda binaria, no hora a hora).
+"""
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from layout_utils import posiciones_validas
+
+ALTURA_PLANO_TRABAJO = 0.8      # m (IES LM-83)
+UMBRAL_SDA_LUX = 300.0          # sDA300/50%
+FRACCION_SDA = 0.5
+HORAS_OCUPADAS = (8, 18)        # 8:00 a 18:00, 3,650 h/año como en LM-83
+MEMORIA_MAX_MB = 256
+# Por debajo de este nº de pares sensor-domo no compensa arrancar procesos
+PARES_MIN_POOL = 20_000_000
+
+# Pool reutilizado entre simulaciones. 'spawn' y no fork: la app corre dentro del servidor
+# multihilo de Streamlit (más los hilos de precarga) y hacer fork de un proceso con hilos no es seguro.
+_POOL = None
+_POOL_PROCESOS = 0
+_POOL_LOCK = threading.Lock()
+
+def malla_sensores(contorno, paso=1.0, huecos=()):
+    """Sensores en cuadrícula de `paso` m dentro de la planta (los patios no se iluminan)."""
+    p = np.asarray(contorno, dtype=float)
+    xs = np.arange(p[:, 0].min() + paso / 2, p[:, 0].max(), paso)
+    ys = np.arange(p[:, 1].min() + paso / 2, p[:, 1].max(), paso)
+    gx, gy = np.meshgrid(xs, ys)
+    gx, gy = gx.ravel(), gy.ravel()
+    valido = posiciones_validas(gx, gy, p, huecos)
+    return np.column_stack([gx[valido], gy[valido]]).astype(np.float32)
+
+def _tamanos_bloque(n_domos, memoria_mb):
+    # ~4 temporales float32 de (bloque_sensores x bloque_domos) vivos a la vez
+    elementos = max(1, int(memoria_mb * 2**20 / (4 * 4)))
+    bloque_domos = min(n_domos, max(1, min(4096, elementos)))
+    bloque_sensores = max(1, elementos // bloque_domos)
+    return bloque_sensores, bloque_domos
+
+def _factor_geometrico(args):
+    """K para un bloque de sensores, recorriendo los domos en sub-bloques (trabajo de un proceso)."""
+    sensores, domos, h, area_domo, memoria_mb = args
+    bloque_s, bloque_d = _tamanos_bloque(len(domos), memoria_mb)
+    h2 = np.float32(h * h)
+    k = np.zeros(len(sensores), dtype=np.float64)
+    for i in range(0, len(sensores), bloque_s):
+        sx = sensores[i:i + bloque_s, 0:1]
+        sy = sensores[i:i + bloque_s, 1:2]
+        acumulado = np.zeros(len(sx), dtype=np.float64)
+        for j in range(0, len(domos), bloque_d):
+            dx = sx - domos[j:j + bloque_d, 0]
+            dy = sy - domos[j:j + bloque_d, 1]
+            d2 = dx * dx
+            d2 += dy * dy
+            d2 += h2
+            np.square(d2, out=d2)
+            acumulado += (h2 / d2).sum(axis=1, dtype=np.float64)
+        k[i:i + bloque_s] = acumulado
+    return k * (area_domo / math.pi)
+
+def _pool(procesos):
+    global _POOL, _POOL_PROCESOS
+    with _POOL_LOCK:
+        if _POOL is None or _POOL_PROCESOS != procesos:
+            if _POOL is not None:
+                _POOL.shutdown(wait=False)
+            _POOL = ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn'))
+            _POOL_PROCESOS = procesos
+        return _POOL
+
+def _descartar_pool(pool):
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is pool:
+            _POOL = None
+
+def factor_geometrico(sensores, domos, h, area_domo, memoria_max_mb=MEMORIA_MAX_MB, procesos=None):
+    """K(s) en lux por lux de exitancia de domo, en bloques y en paralelo si el problema es grande.
+
+    `memoria_max_mb` acota la memoria de trabajo total (se reparte entre procesos).
+    """
+    sensores = np.ascontiguousarray(sensores, dtype=np.float32)
+    domos = np.ascontiguousarray(domos, dtype=np.float32)
+    if len(sensores) == 0 or len(domos) == 0:
+        return np.zeros(len(sensores))
+    procesos = procesos or os.cpu_count() or 1
+    if procesos <= 1 or len(sensores) * len(domos) < PARES_MIN_POOL:
+        return _factor_geometrico((sensores, domos, h, area_domo, memoria_max_mb))
+
+    memoria_proceso = memoria_max_mb / procesos
+    # Varias tareas por proceso para repartir bien la carga
+    partes = np.array_split(sensores, procesos * 4)
+    pool = _pool(procesos)
+    try:
+        resultados = pool.map(_factor_geometrico, [(p, domos, h, area_domo, memoria_proceso) for p in partes])
+        return np.concatenate(list(resultados))
+    except BrokenProcessPool:
+        # Un worker murió (p. ej. por memoria): se rehace el pool la próxima vez y se calcula aquí
+        _descartar_pool(pool)
+        return _factor_geometrico((sensores, domos, h, area_domo, memoria_max_mb))
+
+def horas_ocupadas(n_horas=8760, rango=HORAS_OCUPADAS):
+    hora_del_dia = np.arange(n_horas) % 24
+    return (hora_del_dia >= rango[0]) & (hora_del_dia < rango[1])
+
+def metricas_anuales(k, ilum_exterior, vlt, eficiencia_pozo=0.85, umbral=UMBRAL_SDA_LUX,
+                     fraccion=FRACCION_SDA, ocupadas=None):
+    """sDA, uniformidad e iluminancias anuales a partir de K(s) y la iluminancia exterior horaria.
+
+    Todo es exacto para el modelo separable: un sensor supera `umbral` en la hora t si
+    e(t) >= umbral / K(s), así que basta ordenar e(t) una vez y hacer una búsqueda binaria.
+    """
+    ilum_exterior = np.asarray(ilum_exterior, dtype=np.float64)
+    if ocupadas is None:
+        ocupadas = horas_ocupadas(len(ilum_exterior))
+    e = np.sort(ilum_exterior[ocupadas] * vlt * eficiencia_pozo)
+    n_horas = len(e)
+    k = np.asarray(k, dtype=np.float64)
+
+    with np.errstate(divide='ignore'):
+        e_necesaria = np.where(k > 0, umbral / k, np.inf)
+    horas_ok = n_horas - np.searchsorted(e, e_necesaria, side='left')
+    autonomia = horas_ok / max(n_horas, 1)
+
+    e_media = float(e.mean()) if n_horas else 0.0
+    k_medio = float(k.mean()) if len(k) else 0.0
+    return {
+        'sda': float((autonomia >= fraccion).mean()) if len(k) else 0.0,
+        'autonomia': autonomia,                                   # fracción de horas >= umbral por sensor
+        'iluminancia_media': k * e_media,                         # lux medio por sensor en horas ocupadas
+        'iluminancia_media_global': k_medio * e_media,
+        # En el modelo separable Emin/Emed es igual en todas las horas con luz
+        'uniformidad': float(k.min() / k_medio) if k_medio > 0 else 0.0,
+        'factor_luz_dia': k * vlt * eficiencia_pozo * 100.0,     # % de la iluminancia exterior
+        'horas_ocupadas': n_horas,
+    }
+
+def analizar_iluminacion(contorno, centros_domos, altura_nave, domo_ancho, domo_largo, ilum_exterior, vlt,
+                         huecos=(), paso_sensores=1.0, eficiencia_pozo=0.85, memoria_max_mb=MEMORIA_MAX_MB,
+                         procesos=None):
+    """Malla de sensores + K + métricas anuales para un layout de domos."""
+    sensores = malla_sensores(contorno, paso_sensores, huecos)
+    h = max(altura_nave - ALTURA_PLANO_TRABAJO, 0.1)
+    k = factor_geometrico(sensores, centros_domos, h, domo_ancho * domo_largo, memoria_max_mb, procesos)
+    resultado = metricas_anuales(k, ilum_exterior, vlt, eficiencia_pozo)
+    resultado['sensores'] = sensores
+    return resultado
@@ -1,24 +1,22 @@
 # geometry_utils.py
-import math
+import collections
+import functools
+import hashlib
+import json
+import os
 import pathlib
-from ladybug_geometry.geometry3d.pointvector import Point3D
-from ladybug_geometry.geometry3d.face import Face3D
-from dragonfly.model import Model as DFModel
-from dragonfly.building import Building
-from dragonfly.story import Story
-from dragonfly.room2d import Room2D
-from honeybee.aperture import Aperture
-from honeybee.boundarycondition import Outdoors 
-from honeybee_vtk.model import Model as VTKModel
-
-# Importar Vector3D es CRÍTICO para mover el sol
-from ladybug_geometry.geometry3d.pointvector import Vector3D
-
-# Nuevas rutas para el Motor Solar
-from ladybug_display.visualization import VisualizationSet as LBDVS
-from honeybee_display.model import model_to_vis_set
-from ladybug_vtk.visualization_set import VisualizationSet as VTKVS
-import ladybug_display.extension.sunpath
+import threading
+
+# Ladybug Tools (honeybee, dragonfly, VTK) se importa dentro de cada función: cargar toda esa
+# pila tarda segundos y solo la pestaña 3D la necesita (ver test_startup.py).
+
+# Cascarones (nave sin domos) serializados como HBJSON, reutilizados entre cambios de domos
+CACHE_MODELOS = pathlib.Path('data', 'cache_modelos')
+MAX_CASCARONES_MEMORIA = 8
+_cascarones = collections.OrderedDict()  # clave -> honeybee Model sin domos
+_lock_cascarones = threading.Lock()      # cada sesión de Streamlit corre en su propio hilo
+_firmas_exportadas = {}                  # archivo exportado -> firma de lo que contiene
+
 def _extraer_datos_vis_seguro(v_set):
     """Extrae objetos de visualización probando todos los nombres posibles de 2024 a 2026."""
     for attr in ['display_objects', 'objects', 'data', 'geometries']:
@@ -26,112 +24,233 @@ def _extraer_datos_vis_seguro(v_set):
             return getattr(v_set, attr)
     try: return list(v_set) # Plan B: Intentar iterar directamente
     except: return []
-def generar_nave_3d_vtk(ancho, largo, altura, sfr_objetivo, domo_ancho_m, domo_largo_m, lat=None, lon=None):
+
+def _clave_cascaron(altura, poligono, huecos):
+    """Hash estable de la geometría de la nave (ancho x largo x altura, o planta poligonal)."""
+    datos = [round(float(altura), 4), [[round(float(x), 4), round(float(y), 4)] for x, y in poligono],
+             [[[round(float(x), 4), round(float(y), 4)] for x, y in h] for h in huecos]]
+    return hashlib.sha1(json.dumps(datos).encode('utf-8')).hexdigest()[:16]
+
+def _construir_cascaron(altura, poligono, huecos):
+    from ladybug_geometry.geometry3d.pointvector import Point3D
+    from ladybug_geometry.geometry3d.face import Face3D
+    from dragonfly.model import Model as DFModel
+    from dragonfly.building import Building
+    from dragonfly.story import Story
+    from dragonfly.room2d import Room2D
+    from honeybee.boundarycondition import Outdoors
+
+    # 1. Crear piso y volumen
+    puntos_piso = [Point3D(x, y, 0) for x, y in poligono]
+    huecos_piso = [[Point3D(x, y, 0) for x, y in h] for h in huecos] or None
+    room_df = Room2D('Nave_Principal', Face3D(puntos_piso, holes=huecos_piso), floor_to_ceiling_height=altura)
+    story = Story('Nivel_0', room_2ds=[room_df])
+    building = Building('Planta_Industrial', unique_stories=[story])
+
+    # 2. Pasar a Honeybee
+    hb_model = DFModel('Modelo_Nave', buildings=[building]).to_honeybee(object_per_model='Building')[0]
+
+    # 3. Fix de Boundary Condition (Indispensable para añadir Apertures)
+    techo = [f for f in hb_model.rooms[0].faces if f.type.name == 'RoofCeiling'][0]
+    techo.boundary_condition = Outdoors()
+    return hb_model
+
+def obtener_cascaron(altura, poligono, huecos=()):
+    """Copia del modelo Honeybee de la nave sin domos (techo ya en Outdoors).
+
+    Se cachea en memoria y como HBJSON en CACHE_MODELOS con clave (planta, altura): un cambio
+    solo de SFR o de modelo de domo no vuelve a pasar por Dragonfly.
+    """
+    from honeybee.model import Model
+
+    clave = _clave_cascaron(altura, poligono, huecos)
+    with _lock_cascarones:
+        modelo = _cascarones.get(clave)
+        if modelo is not None:
+            _cascarones.move_to_end(clave)
+    if modelo is None:
+        # Fuera del lock: leer o construir tarda y otras sesiones pueden seguir usando la caché
+        ruta = CACHE_MODELOS / f"cascaron_{clave}.hbjson"
+        if ruta.exists():
+            try:
+                modelo = Model.from_hbjson(str(ruta))
+            except Exception as e:
+                print(f"Aviso: HBJSON de caché ilegible, se reconstruye ({e})")
+        if modelo is None:
+            modelo = _construir_cascaron(altura, poligono, huecos)
+            CACHE_MODELOS.mkdir(parents=True, exist_ok=True)
+            # Nombre temporal + os.replace: otro proceso nunca lee un HBJSON a medio escribir
+            temporal = modelo.to_hbjson(f"{ruta.stem}.{os.getpid()}_{threading.get_ident()}.tmp",
+                                        folder=str(CACHE_MODELOS))
+            os.replace(temporal, ruta)
+        with _lock_cascarones:
+            # Si otra sesión lo guardó mientras tanto se conserva el primero
+            modelo = _cascarones.setdefault(clave, modelo)
+            while len(_cascarones) > MAX_CASCARONES_MEMORIA:
+                _cascarones.popitem(last=False)
+    return modelo.duplicate()
+
+def construir_modelo_nave(ancho, largo, altura, sfr_objetivo, domo_ancho_m, domo_largo_m, poligono=None,
+                          huecos=None, exclusiones=None, holgura_m=0.0):
+    """Modelo Honeybee con domos sobre el cascarón cacheado.
+
+    Devuelve (hb_model, techo, firma, layout): `firma` identifica cascarón + domos y permite
+    saber si hace falta volver a validar o exportar; `layout` ({'contorno', 'huecos', 'centros',
+    'altura'}) es el mismo reparto de domos, para la malla de iluminación.
+    """
+    from ladybug_geometry.geometry3d.pointvector import Point3D
+    from ladybug_geometry.geometry3d.face import Face3D
+    from honeybee.aperture import Aperture
+    from layout_utils import centros_domos
+
+    huecos, exclusiones = list(huecos or []), list(exclusiones or [])
+    if poligono is None:
+        poligono = [(0, 0), (ancho, 0), (ancho, largo), (0, largo)]
+    hb_model = obtener_cascaron(altura, poligono, huecos)
+    techo = [f for f in hb_model.rooms[0].faces if f.type.name == 'RoofCeiling'][0]
+
+    # 4. Layout de domos: cuadrícula simétrica original para naves rectangulares,
+    #    motor poligonal vectorizado para plantas en L, con patios o zonas de exclusión
+    contorno, centros = centros_domos(ancho, largo, sfr_objetivo, domo_ancho_m, domo_largo_m, poligono,
+                               huecos, exclusiones, holgura_m)
+
+    # Solo se reemplazan las aperturas del techo; el resto del cascarón no se toca
+    techo.remove_apertures()
+    for contador, (cx, cy) in enumerate(centros, start=1):
+        pt1 = Point3D(cx - domo_ancho_m/2, cy - domo_largo_m/2, altura)
+        pt2 = Point3D(cx + domo_ancho_m/2, cy - domo_largo_m/2, altura)
+        pt3 = Point3D(cx + domo_ancho_m/2, cy + domo_largo_m/2, altura)
+        pt4 = Point3D(cx - domo_ancho_m/2, cy + domo_largo_m/2, altura)
+
+        cara_domo = Face3D([pt1, pt2, pt3, pt4])
+        techo.add_aperture(Aperture(f"Domo_{contador}", cara_domo))
+
+    firma = hashlib.sha1()
+    firma.update(_clave_cascaron(altura, poligono, huecos).encode('utf-8'))
+    firma.update(repr((round(float(domo_ancho_m), 4), round(float(domo_largo_m), 4))).encode('utf-8'))
+    firma.update(centros.round(4).tobytes())
+    layout = {'contorno': contorno, 'huecos': huecos, 'centros': centros, 'altura': altura}
+    return hb_model, techo, firma.hexdigest()[:16], layout
+
+@functools.lru_cache(maxsize=16)
+def _sunpath_base(lat, lon):
+    """Sunpath sin escalar de una ubicación (se duplica antes de escalarlo y moverlo)."""
+    from ladybug.sunpath import Sunpath
+    import ladybug_display.extension.sunpath
+    return Sunpath(latitude=lat, longitude=lon).to_vis_set()
+
+def _necesita_exportar(ruta, firma):
+    return _firmas_exportadas.get(str(ruta)) != firma or not pathlib.Path(ruta).exists()
+
+def generar_nave_3d_vtk(ancho, largo, altura, sfr_objetivo, domo_ancho_m, domo_largo_m, lat=None, lon=None,
+                        poligono=None, huecos=None, exclusiones=None, holgura_m=0.0):
+    """Nave + domos en VTK. Sin `poligono` la planta es el rectángulo ancho x largo.
+
+    `poligono` (contorno [(x, y), ...]), `huecos` (patios) y `exclusiones` (zonas sin domos)
+    activan el motor de layout poligonal de layout_utils. El cascarón se reutiliza de la
+    caché HBJSON y cada archivo exportado (HBJSON del modelo, VTK de la nave, VTK con sunpath)
+    solo se regenera si cambió lo que contiene. Devuelve (ruta VTK, domos, SFR real, layout),
+    con el layout de construir_modelo_nave.
+    """
+    from honeybee_vtk.model import Model as VTKModel
+
+    # Importar Vector3D es CRÍTICO para mover el sol
+    from ladybug_geometry.geometry3d.pointvector import Vector3D
+
+    # Nuevas rutas para el Motor Solar
+    from ladybug_display.visualization import VisualizationSet as LBDVS
+    from honeybee_display.model import model_to_vis_set
+    from ladybug_vtk.visualization_set import VisualizationSet as VTKVS
+
     try:
-        # 1. Crear piso y volumen
-        puntos_piso = [Point3D(0, 0, 0), Point3D(ancho, 0, 0), Point3D(ancho, largo, 0), Point3D(0, largo, 0)]
-        room_df = Room2D('Nave_Principal', Face3D(puntos_piso), floor_to_ceiling_height=altura)
-        story = Story('Nivel_0', room_2ds=[room_df])
-        building = Building('Planta_Industrial', unique_stories=[story])
-        
-        # 2. Pasar a Honeybee
-        hb_model = DFModel('Modelo_Nave', buildings=[building]).to_honeybee(object_per_model='Building')[0]
-        hb_room = hb_model.rooms[0]
-        
-        # 3. Fix de Boundary Condition (Indispensable para añadir Apertures)
-        techo = [f for f in hb_room.faces if f.type.name == 'RoofCeiling'][0]
-        techo.boundary_condition = Outdoors() 
-        
-        # 4. Algoritmo de Cuadrícula (Homologado a la versión 2D impecable)
-        area_domo = domo_ancho_m * domo_largo_m
-        area_nave = ancho * largo
-        num_domos_teoricos = max(1, math.ceil((area_nave * sfr_objetivo) / area_domo))
-        
-        cols = max(1, round((num_domos_teoricos * (ancho / largo)) ** 0.5))
-        filas = max(1, math.ceil(num_domos_teoricos / cols))
-        
-        dx, dy = ancho / cols, largo / filas
-        contador = 1
-        
-        # LA MAGIA: Eliminamos el 'break' para forzar la simetría completa (cols * filas)
-        for i in range(cols):
-            for j in range(filas):
-                cx = (i * dx) + (dx / 2)
-                cy = (j * dy) + (dy / 2)
-                
-                pt1 = Point3D(cx - domo_ancho_m/2, cy - domo_largo_m/2, altura)
-                pt2 = Point3D(cx + domo_ancho_m/2, cy - domo_largo_m/2, altura)
-                pt3 = Point3D(cx + domo_ancho_m/2, cy + domo_largo_m/2, altura)
-                pt4 = Point3D(cx - domo_ancho_m/2, cy + domo_largo_m/2, altura)
-                
-                cara_domo = Face3D([pt1, pt2, pt3, pt4])
-                techo.add_aperture(Aperture(f"Domo_{contador}", cara_domo))
-                contador += 1
-
-        # ==========================================
-        # 5. VALIDACIÓN OFICIAL PARA LBT (EnergyPlus / Radiance)
-        # ==========================================
-        reporte_validacion = hb_model.check_all()
-        if reporte_validacion:
-            print(f"⚠️ El modelo tiene problemas LBT: {reporte_validacion}")
-        else:
-            print("✅ GEOMETRÍA PERFECTA: Modelo LBT 100% válido para simulación.")
+        x0 = y0 = 0.0
+        if poligono is not None:
+            # La caja envolvente sustituye a ancho x largo (escala y centro del sunpath)
+            x0, y0 = min(x for x, _ in poligono), min(y for _, y in poligono)
+            ancho = max(x for x, _ in poligono) - x0
+            largo = max(y for _, y in poligono) - y0
+
+        # 1-4. Cascarón cacheado + domos
+        hb_model, techo, firma, layout = construir_modelo_nave(ancho, largo, altura, sfr_objetivo, domo_ancho_m,
+                                                       domo_largo_m, poligono, huecos, exclusiones, holgura_m)
 
-       # 6. EXPORTAR A VTK (Nave + Sunpath Blindado)
         vtk_file = pathlib.Path('data', 'nave_industrial.vtkjs')
         vtk_file.parent.mkdir(parents=True, exist_ok=True)
-        
+        hbjson_file = vtk_file.with_suffix('.hbjson')
+        vtk_solo = vtk_file.with_name(f"{vtk_file.stem}_solo.vtkjs")
+        firma_final = f"{firma}_{lat}_{lon}"
+
+        if _necesita_exportar(hbjson_file, firma):
+            # ==========================================
+            # 5. VALIDACIÓN OFICIAL PARA LBT (EnergyPlus / Radiance)
+            # ==========================================
+            reporte_validacion = hb_model.check_all()
+            if reporte_validacion:
+                print(f"⚠️ El modelo tiene problemas LBT: {reporte_validacion}")
+            else:
+                print("✅ GEOMETRÍA PERFECTA: Modelo LBT 100% válido para simulación.")
+
+            # Modelo serializado estable para la simulación aguas abajo
+            hb_model.to_hbjson(hbjson_file.stem, folder=str(hbjson_file.parent))
+            _firmas_exportadas[str(hbjson_file)] = firma
+
+       # 6. EXPORTAR A VTK (Nave + Sunpath Blindado)
         try:
-            # Convertimos la nave a formato visual
-            vis_set_nave = model_to_vis_set(hb_model)
-            
+            vis_set_nave = None
+            if _necesita_exportar(vtk_solo, firma) or _necesita_exportar(vtk_file, firma_final):
+                # Convertimos la nave a formato visual
+                vis_set_nave = model_to_vis_set(hb_model)
+
             # NUEVO: Guardamos una versión "Limpia" (Solo Nave) para el Toggle
-            vtk_solo = VTKVS.from_visualization_set(vis_set_nave)
-            vtk_solo.to_vtkjs(folder=str(vtk_file.parent), name=f"{vtk_file.stem}_solo")
-            
-            if lat is not None and lon is not None:
-                from ladybug.sunpath import Sunpath
-                
-                # A) Crear Sunpath y escalarlo manualmente (evita el TypeError)
-                sp = Sunpath(latitude=lat, longitude=lon)
-                sp_vis_set = sp.to_vis_set()
-                
+            if _necesita_exportar(vtk_solo, firma):
+                VTKVS.from_visualization_set(vis_set_nave).to_vtkjs(folder=str(vtk_file.parent), name=vtk_solo.stem)
+                _firmas_exportadas[str(vtk_solo)] = firma
+
+            if not _necesita_exportar(vtk_file, firma_final):
+                pass  # Misma nave, mismos domos y misma ubicación: el VTK ya está al día
+            elif lat is not None and lon is not None:
+                # A) Sunpath cacheado por ubicación, escalado manualmente (evita el TypeError)
+                sp_vis_set = _sunpath_base(lat, lon).duplicate()
+
                 radio = (max(ancho, largo) * 1.5) / 100.0
                 sp_vis_set.scale(radio)
-                sp_vis_set.move(Vector3D(ancho/2, largo/2, altura/2))
-                
+                sp_vis_set.move(Vector3D(x0 + ancho/2, y0 + largo/2, altura/2))
+
                 # B) Fusión usando la Sonda Detective
                 objs_nave = _extraer_datos_vis_seguro(vis_set_nave)
                 objs_sol = _extraer_datos_vis_seguro(sp_vis_set)
                 todo = list(objs_nave) + list(objs_sol)
-                
+
                 # C) Crear set final (Plan A o B de Colab)
                 try:
                     vis_set_final = LBDVS(todo, identifier='EscenaSolar')
                 except TypeError:
                     vis_set_final = LBDVS(identifier='EscenaSolar', geometry=todo)
-                    
+
                 vtk_final = VTKVS.from_visualization_set(vis_set_final)
                 vtk_final.to_vtkjs(folder=str(vtk_file.parent), name=vtk_file.stem)
+                _firmas_exportadas[str(vtk_file)] = firma_final
             else:
                 # Renderizado simple si no hay ubicación
                 VTKModel(hb_model).to_vtkjs(folder=str(vtk_file.parent), name=vtk_file.stem)
-                
+                _firmas_exportadas[str(vtk_file)] = firma_final
+
         except Exception as e:
             print(f"Aviso Sunpath: Falló el motor avanzado ({e}). Usando renderizado de emergencia.")
+            _firmas_exportadas.pop(str(vtk_file), None)
             try:
                 vtk_model = VTKModel(hb_model)
                 vtk_model.to_vtkjs(folder=str(vtk_file.parent), name=vtk_file.stem)
             except Exception as e2:
                 print(f"Error crítico al generar VTK: {e2}")
-                return None, 0, 0
-        
+                return None, 0, 0, None
+
         # Cálculo final de métricas 
         area_domos_total = sum([ap.area for ap in techo.apertures])
         sfr_real = (area_domos_total / techo.area)
-        
-        return str(vtk_file), len(techo.apertures), sfr_real
+
+        return str(vtk_file), len(techo.apertures), sfr_real, layout
 
     except Exception as e:
         print(f"Error en geometría: {e}")
-        return None, 0, 0
+        return None, 0, 0, None
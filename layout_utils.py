@@ -0,0 +1,243 @@
+# layout_utils.py
+"""Motor de distribución de domos para plantas poligonales (solo NumPy).
+
+La planta es un contorno exterior con huecos opcionales (patios: no son techo) y zonas de
+exclusión (equipos HVAC, grúas: son techo pero no admiten domos). Los domos se colocan en una
+cuadrícula recortada a la planta con un test punto-en-polígono vectorizado; la holgura a
+bordes, patios y exclusiones se comprueba con un hash espacial de segmentos, así que solo los
+candidatos cercanos a algún borde calculan distancias. El espaciado se ajusta hasta alcanzar
+el SFR objetivo, todo antes de construir una sola Aperture de Honeybee.
+"""
+import math
+import numpy as np
+
+def area_poligono(anillo):
+    """Área (fórmula del zapato) de un anillo [(x, y), ...]; siempre positiva."""
+    p = np.asarray(anillo, dtype=float)
+    x, y = p[:, 0], p[:, 1]
+    return abs(float(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))) / 2.0
+
+def puntos_en_poligono(px, py, anillo):
+    """Máscara de los puntos (px, py) dentro del anillo (regla par-impar, vectorizada)."""
+    p = np.asarray(anillo, dtype=float)
+    dentro = np.zeros(px.shape, dtype=bool)
+    x1, y1 = p[:, 0], p[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+    # Un bucle por arista (pocas), cada una vectorizada sobre todos los puntos
+    for ax, ay, bx, by in zip(x1, y1, x2, y2):
+        if ay == by:
+            continue
+        cruza = (ay > py) != (by > py)
+        x_corte = ax + (py - ay) * (bx - ax) / (by - ay)
+        dentro ^= cruza & (px < x_corte)
+    return dentro
+
+def _segmentos(anillos):
+    segs = []
+    for anillo in anillos:
+        p = np.asarray(anillo, dtype=float)
+        segs.append(np.hstack([p, np.roll(p, -1, axis=0)]))
+    return np.vstack(segs) if segs else np.empty((0, 4))
+
+class HashSegmentos:
+    """Hash espacial de segmentos en celdas de lado `radio` para consultas de holgura."""
+
+    def __init__(self, segmentos, radio):
+        self.radio = float(radio)
+        self.segmentos = np.asarray(segmentos, dtype=float)
+        if len(self.segmentos) == 0 or self.radio <= 0:
+            self.claves = np.empty(0, dtype=np.int64)
+            self.ids = np.empty(0, dtype=np.int64)
+            return
+        ax, ay, bx, by = self.segmentos.T
+        # Muestrear cada segmento cada `radio` y registrar las celdas a ±2 de cada muestra:
+        # todo punto a menos de `radio` del segmento cae en alguna de ellas.
+        n_muestras = np.maximum(1, np.ceil(np.hypot(bx - ax, by - ay) / self.radio).astype(int)) + 1
+        seg_id = np.repeat(np.arange(len(self.segmentos)), n_muestras)
+        inicio = np.repeat(np.cumsum(n_muestras) - n_muestras, n_muestras)
+        t = (np.arange(len(seg_id)) - inicio) / np.repeat(n_muestras - 1, n_muestras)
+        cx = np.floor((ax[seg_id] + t * (bx - ax)[seg_id]) / self.radio).astype(np.int64)
+        cy = np.floor((ay[seg_id] + t * (by - ay)[seg_id]) / self.radio).astype(np.int64)
+        dx, dy = np.meshgrid(np.arange(-2, 3), np.arange(-2, 3))
+        claves = self._clave(cx[:, None] + dx.ravel(), cy[:, None] + dy.ravel()).ravel()
+        ids = np.repeat(seg_id, dx.size)
+        pares = np.unique(np.stack([claves, ids], axis=1), axis=0)
+        self.claves, self.ids = pares[:, 0], pares[:, 1]
+
+    @staticmethod
+    def _clave(cx, cy):
+        return cx * 2_000_003 + cy
+
+    def demasiado_cerca(self, px, py):
+        """Máscara de puntos a menos de `radio` de algún segmento."""
+        cerca = np.zeros(px.shape, dtype=bool)
+        if len(self.claves) == 0:
+            return cerca
+        claves = self._clave(np.floor(px / self.radio).astype(np.int64), np.floor(py / self.radio).astype(np.int64))
+        ini = np.searchsorted(self.claves, claves, side='left')
+        fin = np.searchsorted(self.claves, claves, side='right')
+        n = fin - ini
+        con_bordes = np.nonzero(n)[0]
+        if len(con_bordes) == 0:
+            return cerca
+        # Expandir pares (punto, segmento) solo para los puntos en celdas con bordes
+        punto = np.repeat(con_bordes, n[con_bordes])
+        offs = np.arange(len(punto)) - np.repeat(np.cumsum(n[con_bordes]) - n[con_bordes], n[con_bordes])
+        seg = self.ids[np.repeat(ini[con_bordes], n[con_bordes]) + offs]
+        ax, ay, bx, by = self.segmentos[seg].T
+        qx, qy = px[punto], py[punto]
+        vx, vy = bx - ax, by - ay
+        largo2 = np.maximum(vx * vx + vy * vy, 1e-12)
+        t = np.clip(((qx - ax) * vx + (qy - ay) * vy) / largo2, 0.0, 1.0)
+        d2 = (qx - ax - t * vx) ** 2 + (qy - ay - t * vy) ** 2
+        np.logical_or.at(cerca, punto, d2 < self.radio ** 2)
+        return cerca
+
+def posiciones_validas(px, py, contorno, huecos=(), exclusiones=(), hash_bordes=None):
+    """Máscara de candidatos dentro de la planta, fuera de huecos/exclusiones y con holgura."""
+    valido = puntos_en_poligono(px, py, contorno)
+    for zona in list(huecos) + list(exclusiones):
+        valido &= ~puntos_en_poligono(px, py, zona)
+    if hash_bordes is not None and valido.any():
+        idx = np.nonzero(valido)[0]
+        valido[idx[hash_bordes.demasiado_cerca(px[idx], py[idx])]] = False
+    return valido
+
+def _cuadricula(bbox, nx, ny, escala=1.0):
+    """Centros de nx x ny celdas iguales que reparten la caja envolvente (como layout_rectangular),
+    reducida a `escala` alrededor de su centro."""
+    xmin, ymin, xmax, ymax = bbox
+    px, py = escala * (xmax - xmin) / nx, escala * (ymax - ymin) / ny
+    x0 = (xmin + xmax - nx * px) / 2.0
+    y0 = (ymin + ymax - ny * py) / 2.0
+    gx, gy = np.meshgrid(x0 + px * (np.arange(nx) + 0.5), y0 + py * (np.arange(ny) + 0.5))
+    return gx.ravel(), gy.ravel()
+
+def generar_layout_domos(contorno, sfr_objetivo, domo_ancho, domo_largo, huecos=(), exclusiones=(),
+                         holgura=0.0, max_columnas=24, max_anisotropia=1.5, escalas=(1.0, 0.95, 0.9)):
+    """Centros de domos sobre una planta poligonal que alcanzan (o superan lo mínimo) el SFR.
+
+    La cuadrícula es siempre regular: nx columnas x ny filas que reparten la caja envolvente
+    (o la caja reducida a cada una de las `escalas`, que mete las filas de borde hacia dentro).
+    Se prueban unas pocas columnas alrededor del paso isótropo y, para cada una, las filas
+    justas para llegar al objetivo; gana la combinación con menos domos sobrantes y pasos x/y
+    parecidos (razón <= `max_anisotropia`), así que nunca se quitan domos sueltos. Devuelve un
+    dict con 'centros' (array n x 2), 'area_techo' (contorno - huecos), 'sfr_real', 'paso'
+    (px, py) y 'candidatos' de la cuadrícula elegida. Si ni con el paso mínimo (domos casi
+    tocándose) caben suficientes, devuelve el máximo posible.
+    """
+    contorno = np.asarray(contorno, dtype=float)
+    area_techo = area_poligono(contorno) - sum(area_poligono(h) for h in huecos)
+    area_util = area_techo - sum(area_poligono(z) for z in exclusiones)
+    area_domo = domo_ancho * domo_largo
+    n_objetivo = max(1, math.ceil(area_techo * sfr_objetivo / area_domo))
+
+    # Radio de holgura: semidiagonal del domo (así no pisa ningún borde) + holgura pedida
+    radio = math.hypot(domo_ancho, domo_largo) / 2.0 + holgura
+    hash_bordes = HashSegmentos(_segmentos([contorno] + list(huecos) + list(exclusiones)), radio)
+    bbox = (contorno[:, 0].min(), contorno[:, 1].min(), contorno[:, 0].max(), contorno[:, 1].max())
+    ancho, largo = bbox[2] - bbox[0], bbox[3] - bbox[1]
+    paso_min = max(domo_ancho, domo_largo) + holgura
+    nx_max, ny_max = max(1, int(ancho // paso_min)), max(1, int(largo // paso_min))
+
+    evaluados = {}
+    def evaluar(nx, ny, escala):
+        if (nx, ny, escala) not in evaluados:
+            gx, gy = _cuadricula(bbox, nx, ny, escala)
+            valido = posiciones_validas(gx, gy, contorno, huecos, exclusiones, hash_bordes)
+            evaluados[nx, ny, escala] = np.column_stack([gx[valido], gy[valido]])
+        return evaluados[nx, ny, escala]
+
+    # Fracción de celdas válidas; se corrige con cada cuadrícula evaluada
+    densidad = min(1.0, max(area_util, area_domo) / max(ancho * largo, 1e-9))
+    def filas_para(nx, ny_tope):
+        return min(ny_tope, max(1, math.ceil(n_objetivo / max(densidad * nx, 1e-9))))
+
+    paso = max(paso_min, math.sqrt(max(area_util, area_domo) / n_objetivo))
+    nx0 = min(nx_max, max(1, round(ancho / paso)))
+    columnas = sorted(range(1, nx_max + 1), key=lambda nx: abs(nx - nx0))[:max_columnas]
+    mejor = None  # (domos, anisotropía del paso, nx, ny, escala)
+    for nx in columnas:
+        for escala in escalas:
+            # El paso reducido tampoco puede bajar del mínimo
+            if escala * ancho / nx < paso_min:
+                continue
+            ny_tope = max(1, int(escala * largo // paso_min))
+            ny = filas_para(nx, ny_tope)
+            for _ in range(8):
+                n = len(evaluar(nx, ny, escala))
+                densidad = n / (nx * ny) if n else densidad
+                if n < n_objetivo:
+                    if ny >= ny_tope:
+                        break
+                    ny = max(ny + 1, filas_para(nx, ny_tope))
+                elif ny > 1 and len(evaluar(nx, ny - 1, escala)) >= n_objetivo:
+                    ny = min(ny - 1, filas_para(nx, ny_tope))
+                else:
+                    break
+            n = len(evaluar(nx, ny, escala))
+            anisotropia = abs(math.log((ancho / nx) / (largo / ny)))
+            # Pasos x/y muy distintos dejarían franjas más oscuras entre filas o columnas
+            if n >= n_objetivo and anisotropia <= math.log(max_anisotropia):
+                clave = (n, anisotropia, nx, ny, escala)
+                mejor = min(mejor, clave) if mejor else clave
+        if mejor and mejor[0] <= n_objetivo * 1.01:
+            break
+    if mejor is None:
+        mejor = (len(evaluar(nx_max, ny_max, 1.0)), 0.0, nx_max, ny_max, 1.0)
+
+    _, _, nx, ny, escala = mejor
+    centros = evaluar(nx, ny, escala)
+    return {
+        'centros': centros,
+        'area_techo': area_techo,
+        'sfr_real': len(centros) * area_domo / area_techo if area_techo > 0 else 0.0,
+        'paso': (escala * ancho / nx, escala * largo / ny),
+        'candidatos': nx * ny,
+    }
+
+def layout_rectangular(ancho, largo, sfr_objetivo, domo_ancho, domo_largo):
+    """Cuadrícula simétrica cols x filas para una nave rectangular (algoritmo original 2D)."""
+    area_domo = domo_ancho * domo_largo
+    num_domos_teoricos = max(1, math.ceil((ancho * largo * sfr_objetivo) / area_domo))
+    cols = max(1, round((num_domos_teoricos * (ancho / largo)) ** 0.5))
+    filas = max(1, math.ceil(num_domos_teoricos / cols))
+    dx, dy = ancho / cols, largo / filas
+    # Sin 'break': se fuerza la simetría completa (cols * filas)
+    gx, gy = np.meshgrid((np.arange(cols) + 0.5) * dx, (np.arange(filas) + 0.5) * dy, indexing='ij')
+    return np.column_stack([gx.ravel(), gy.ravel()])
+
+def centros_domos(ancho, largo, sfr_objetivo, domo_ancho, domo_largo, poligono=None, huecos=(),
+                  exclusiones=(), holgura=0.0):
+    """Centros de domos para la nave: cuadrícula original si es un rectángulo simple, motor
+    poligonal en otro caso. Devuelve (contorno, centros)."""
+    if poligono is None:
+        poligono = [(0, 0), (ancho, 0), (ancho, largo), (0, largo)]
+    if es_rectangulo(poligono) and not huecos and not exclusiones and not holgura:
+        xs, ys = [x for x, _ in poligono], [y for _, y in poligono]
+        return poligono, layout_rectangular(max(xs), max(ys), sfr_objetivo, domo_ancho, domo_largo)
+    layout = generar_layout_domos(poligono, sfr_objetivo, domo_ancho, domo_largo,
+                                  huecos=huecos, exclusiones=exclusiones, holgura=holgura)
+    return poligono, layout['centros']
+
+def es_rectangulo(contorno):
+    """True si el contorno es un rectángulo alineado a los ejes con esquina en el origen."""
+    p = np.asarray(contorno, dtype=float)
+    if len(p) != 4:
+        return False
+    xs, ys = np.unique(p[:, 0]), np.unique(p[:, 1])
+    return len(xs) == 2 and len(ys) == 2 and xs[0] == 0 and ys[0] == 0
+
+def parsear_poligonos(texto):
+    """Polígonos desde texto: un vértice 'x, y' por línea y una línea en blanco entre polígonos."""
+    poligonos, actual = [], []
+    for linea in (texto or '').splitlines() + ['']:
+        linea = linea.strip()
+        if not linea:
+            if len(actual) >= 3:
+                poligonos.append(actual)
+            actual = []
+            continue
+        x, y = (float(v) for v in linea.replace(';', ',').split(',')[:2])
+        actual.append((x, y))
+    return poligonos
@@ -0,0 +1,198 @@
+# mirror_utils.py
+"""Espejo local de OneBuilding por países o regiones WMO.
+
+Uso:
+    python mirror_utils.py Mexico ESP WMO_Region_3 --workers 6
+    python mirror_utils.py --listar
+
+Cada zip TMYx se descarga a la misma ruta relativa que tiene en climate.onebuilding.org
+(reanudable vía .part + HTTP Range, verificado por CRC del zip y sha256 registrado en un
+sidecar) y se convierte al formato compacto de clima de la app junto al zip. Con el espejo
+presente, weather_utils sirve índices, zips y climas desde disco sin tocar la red.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from weather_utils import (
+    MIRROR_DIR, ONEBUILDING_MAPPING, archivo_en_mirror, cargar_clima_compacto, escribir_sidecar,
+    guardar_clima_compacto, listar_estaciones, procesar_datos_clima, ruta_clima_mirror,
+    ruta_en_mirror, sha256_archivo,
+)
+
+HEADERS = {'User-Agent': 'Mozilla/5.0 (SkyCalc mirror)'}
+BLOQUE = 1 << 16
+_print_lock = threading.Lock()
+
+def _log(msg):
+    with _print_lock:
+        print(msg, flush=True)
+
+def resolver_paises(selectores):
+    """Traduce nombres de país, códigos ISO3 o regiones WMO a claves de ONEBUILDING_MAPPING.
+
+    Un selector coincide con una clave exacta ("MEX_Mexico"), su código ("MEX"), su nombre
+    ("Mexico", "costa rica") o con el segmento de región de la URL ("WMO_Region_4", "Region_4").
+    """
+    claves = []
+    for sel in selectores:
+        s = sel.strip().lower().replace(' ', '_')
+        encontrados = []
+        for clave, url in ONEBUILDING_MAPPING.items():
+            codigo, _, nombre = clave.partition('_')
+            region = url.split('/')[3].lower()
+            if (s in (clave.lower(), codigo.lower(), nombre.lower())
+                    or region.startswith(s) or region.startswith('wmo_' + s)):
+                encontrados.append(clave)
+        if not encontrados:
+            raise ValueError(f"Selector sin coincidencias en onebuilding_mapping.json: {sel}")
+        claves.extend(c for c in encontrados if c not in claves)
+    return claves
+
+def descargar_reanudable(url, destino, reintentos=3):
+    """Descarga url en destino vía destino.part, reanudando con Range si quedó a medias.
+
+    Devuelve True si el archivo ya estaba verificado o se descargó; los zips además se validan
+    con sus CRC internos antes de registrar el sha256 en el sidecar.
+    """
+    if archivo_en_mirror_local(destino):
+        return True
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    parcial = destino + '.part'
+    for intento in range(reintentos):
+        offset = os.path.getsize(parcial) if os.path.exists(parcial) else 0
+        req = urllib.request.Request(url, headers=dict(HEADERS, **({'Range': f'bytes={offset}-'} if offset else {})))
+        try:
+            with urllib.request.urlopen(req, timeout=30) as resp:
+                # 206 = el servidor acepta reanudar; 200 = reenvía todo y se sobrescribe
+                modo = 'ab' if offset and resp.status == 206 else 'wb'
+                with open(parcial, modo) as out:
+                    shutil.copyfileobj(resp, out, BLOQUE)
+        except urllib.error.HTTPError as e:
+            if e.code == 416:  # Range fuera de límites: el .part ya está completo o corrupto
+                if not _zip_valido(parcial, destino):
+                    os.remove(parcial)
+                    continue
+            else:
+                _log(f"  HTTP {e.code} en {url} (intento {intento + 1})")
+                continue
+        except (urllib.error.URLError, OSError) as e:
+            _log(f"  Red: {e} en {url} (intento {intento + 1})")
+            continue
+
+        if not _zip_valido(parcial, destino):
+            os.remove(parcial)
+            continue
+        os.replace(parcial, destino)
+        escribir_sidecar(destino)
+        return True
+    return False
+
+def _zip_valido(parcial, destino):
+    if not destino.endswith('.zip'):
+        return True
+    try:
+        with zipfile.ZipFile(parcial) as z:
+            return z.testzip() is None
+    except (zipfile.BadZipFile, OSError):
+        return False
+
+def archivo_en_mirror_local(path):
+    """True si path existe y su sha256 coincide con el sidecar (verificación completa)."""
+    try:
+        with open(path + '.sha256') as f:
+            esperado, _ = f.read().split()
+        return sha256_archivo(path) == esperado
+    except (OSError, ValueError):
+        return False
+
+def convertir_estacion(url_zip, mirror_dir):
+    """Genera el clima compacto junto al zip espejado (si no existe ya)."""
+    ruta_base = ruta_clima_mirror(url_zip, mirror_dir)
+    if cargar_clima_compacto(ruta_base):
+        return True
+    zip_fn = archivo_en_mirror(url_zip, mirror_dir)
+    if not zip_fn:
+        return False
+    temp_dir = tempfile.mkdtemp(prefix="epw_mirror_")
+    try:
+        with zipfile.ZipFile(zip_fn) as z:
+            epws = [n for n in z.namelist() if n.endswith('.epw')]
+            if not epws:
+                return False
+            epw_path = z.extract(epws[0], temp_dir)
+        data = procesar_datos_clima(epw_path)
+        if not data:
+            return False
+        guardar_clima_compacto(data, ruta_base)
+        return True
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def espejar_estacion(url_zip, mirror_dir, convertir=True):
+    ok = descargar_reanudable(url_zip, ruta_en_mirror(url_zip, mirror_dir))
+    if ok and convertir:
+        ok = convertir_estacion(url_zip, mirror_dir)
+    return url_zip, ok
+
+def espejar_paises(claves, mirror_dir=None, workers=4, convertir=True):
+    """Descarga índices y estaciones de los países dados con como máximo `workers` transferencias."""
+    mirror_dir = mirror_dir or MIRROR_DIR
+    tareas = []
+    for clave in claves:
+        country_url = ONEBUILDING_MAPPING[clave]
+        indice = ruta_en_mirror(country_url, mirror_dir)
+        # El índice se vuelve a bajar siempre: es pequeño y puede traer estaciones nuevas
+        if os.path.exists(indice + '.sha256'):
+            os.remove(indice + '.sha256')
+        if not descargar_reanudable(country_url, indice):
+            _log(f"✗ {clave}: no se pudo descargar el índice")
+            continue
+        with open(indice, 'r', encoding='utf-8', errors='replace') as f:
+            estaciones = listar_estaciones(f.read(), country_url)
+        _log(f"• {clave}: {len(estaciones)} estaciones")
+        tareas.extend(e['URL_ZIP'] for e in estaciones)
+
+    fallidas = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futuros = [pool.submit(espejar_estacion, url, mirror_dir, convertir) for url in tareas]
+        for i, fut in enumerate(as_completed(futuros), 1):
+            url, ok = fut.result()
+            if not ok:
+                fallidas.append(url)
+            _log(f"  [{i}/{len(tareas)}] {'✓' if ok else '✗'} {url.split('/')[-1]}")
+    return len(tareas) - len(fallidas), fallidas
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Espejo local de climas TMYx de OneBuilding.")
+    parser.add_argument('selectores', nargs='*', help="Países (MEX, Mexico, MEX_Mexico) o regiones WMO (WMO_Region_4)")
+    parser.add_argument('--destino', default=MIRROR_DIR, help=f"Carpeta del espejo (por defecto {MIRROR_DIR}; o SKYCALC_MIRROR)")
+    parser.add_argument('--workers', type=int, default=4, help="Descargas simultáneas")
+    parser.add_argument('--sin-convertir', action='store_true', help="Solo descargar los zips")
+    parser.add_argument('--listar', action='store_true', help="Mostrar países y regiones disponibles")
+    args = parser.parse_args(argv)
+
+    if args.listar or not args.selectores:
+        for clave, url in ONEBUILDING_MAPPING.items():
+            print(f"{url.split('/')[3]:45s} {clave}")
+        return 0
+
+    try:
+        claves = resolver_paises(args.selectores)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    ok, fallidas = espejar_paises(claves, args.destino, args.workers, not args.sin_convertir)
+    print(f"Listo: {ok} estaciones en {args.destino}, {len(fallidas)} fallidas.")
+    return 1 if fallidas else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
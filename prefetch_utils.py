@@ -0,0 +1,108 @@
+# prefetch_utils.py
+"""Precarga en segundo plano del clima de las estaciones más cercanas.
+
+Tras una búsqueda, cada sesión programa sus K estaciones más cercanas en un pool de hilos
+compartido por todo el proceso (workers acotados). Una misma URL se descarga una sola vez
+aunque varias sesiones la pidan; cuando ninguna sesión la necesita ya (cambio de ubicación),
+la tarea se cancela si aún no empezó o se aborta entre bloques de descarga si estaba en curso.
+Los resultados quedan en la caché de clima, así que "Descargar Datos" suele ser instantáneo.
+"""
+import os
+import threading
+import weakref
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+from weather_utils import clima_en_cache, obtener_clima
+
+PREFETCH_K = int(os.environ.get("SKYCALC_PREFETCH_K", 3))
+PREFETCH_WORKERS = int(os.environ.get("SKYCALC_PREFETCH_WORKERS", 3))
+
+_EJECUTOR = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="skycalc_prefetch")
+_LOCK = threading.RLock()  # reentrante: add_done_callback puede ejecutarse en el acto
+_TAREAS = {}  # url -> _Tarea en curso o pendiente
+
+class _Tarea:
+    def __init__(self, url):
+        self.url = url
+        self.interesados = 0
+        self.future = None
+
+    def cancelada(self):
+        return self.interesados <= 0
+
+def _ejecutar(tarea):
+    try:
+        return obtener_clima(tarea.url, cancelado=tarea.cancelada)
+    except Exception as e:
+        print(f"Aviso prefetch ({tarea.url}): {e}")
+        return None
+
+def _terminar(tarea):
+    with _LOCK:
+        if _TAREAS.get(tarea.url) is tarea:
+            del _TAREAS[tarea.url]
+
+def _registrar(url):
+    with _LOCK:
+        tarea = _TAREAS.get(url)
+        if tarea is not None:
+            tarea.interesados += 1
+            return True
+        if clima_en_cache(url):
+            return False
+        tarea = _TAREAS[url] = _Tarea(url)
+        tarea.interesados = 1
+        tarea.future = _EJECUTOR.submit(_ejecutar, tarea)
+        tarea.future.add_done_callback(lambda _f, t=tarea: _terminar(t))
+        return True
+
+def _liberar(url):
+    with _LOCK:
+        tarea = _TAREAS.get(url)
+        if tarea is None:
+            return
+        tarea.interesados -= 1
+        if tarea.cancelada():
+            # Si aún está en cola no llega a ejecutarse; si corre, se aborta entre bloques
+            tarea.future.cancel()
+            del _TAREAS[url]
+
+def _liberar_todas(urls):
+    for url in urls:
+        _liberar(url)
+    urls.clear()
+
+class PrefetchClima:
+    """Precargas de una sesión: programar() reemplaza (y cancela) las de la búsqueda anterior."""
+
+    def __init__(self, k=PREFETCH_K):
+        self.k = k
+        self._urls = []
+        # Una sesión cerrada no llama a cancelar(): su interés se devuelve al recolectarla
+        weakref.finalize(self, _liberar_todas, self._urls)
+
+    def programar(self, urls):
+        self.cancelar()
+        for url in [u for u in urls if u][:self.k]:
+            if _registrar(url):
+                self._urls.append(url)
+
+    def cancelar(self):
+        _liberar_todas(self._urls)
+
+    def pendientes(self):
+        with _LOCK:
+            return [u for u in self._urls if u in _TAREAS]
+
+    def obtener(self, url, timeout=None):
+        """Clima de `url`: espera la precarga si está en curso; si no, lo obtiene directamente."""
+        with _LOCK:
+            tarea = _TAREAS.get(url)
+        if tarea is not None:
+            try:
+                data = tarea.future.result(timeout=timeout)
+                if data:
+                    return data
+            except CancelledError:
+                pass
+        return obtener_clima(url)
@@ -0,0 +1,140 @@
+# psychro_utils.py
+"""Psicrometría y confort adaptativo de las 8,760 horas del EPW (solo NumPy).
+
+Fórmulas de ASHRAE Fundamentals (2017, cap. 1): presión de saturación de Hyland-Wexler,
+razón de humedad, punto de rocío, entalpía del aire húmedo y bulbo húmedo termodinámico
+(resuelto por bisección simultánea en todas las horas). El confort adaptativo sigue
+ASHRAE 55: temperatura media exterior predominante como media móvil exponencial de las
+medias diarias y banda de aceptabilidad del 80%.
+"""
+import numpy as np
+
+# Consignas para las horas de carga de HVAC
+T_CONSIGNA_FRIO = 24.0      # °C, bulbo seco por encima del cual hay carga sensible de frío
+W_MAX_CONFORT = 0.012       # kg/kg, límite de humedad de ASHRAE 55
+ALFA_MEDIA_MOVIL = 0.8      # constante de la media exterior predominante (EN 16798 / ASHRAE 55)
+DIAS_MEDIA_MOVIL = 30
+
+# Rejilla de la carta psicrométrica: bulbo seco (°C) x razón de humedad (g/kg)
+BORDES_T = np.arange(-20.0, 51.0, 1.0)
+BORDES_W = np.arange(0.0, 31.0, 1.0)
+
+FRIO, CONFORT, CALOR = -1, 0, 1
+
+def presion_atmosferica(elevacion_m):
+    """Presión estándar (Pa) a una elevación dada (ASHRAE, ec. 3)."""
+    return 101325.0 * (1.0 - 2.25577e-5 * float(elevacion_m or 0.0)) ** 5.2559
+
+def presion_saturacion(t):
+    """Presión de vapor de saturación (Pa) sobre hielo (t < 0 °C) o agua (ec. 5 y 6)."""
+    tk = np.asarray(t, dtype=np.float64) + 273.15
+    hielo = (-5.6745359e3 / tk + 6.3925247 - 9.677843e-3 * tk + 6.2215701e-7 * tk**2
+             + 2.0747825e-9 * tk**3 - 9.484024e-13 * tk**4 + 4.1635019 * np.log(tk))
+    agua = (-5.8002206e3 / tk + 1.3914993 - 4.8640239e-2 * tk + 4.1764768e-5 * tk**2
+            - 1.4452093e-8 * tk**3 + 6.5459673 * np.log(tk))
+    return np.exp(np.where(tk < 273.15, hielo, agua))
+
+def razon_humedad(t, hr, p=101325.0):
+    """Razón de humedad (kg agua / kg aire seco) desde bulbo seco (°C) y humedad relativa (%)."""
+    pw = np.clip(np.asarray(hr, dtype=np.float64), 0.0, 100.0) / 100.0 * presion_saturacion(t)
+    return 0.621945 * pw / (p - pw)
+
+def punto_rocio(w, p=101325.0):
+    """Temperatura de rocío (°C) desde la razón de humedad (ec. 39 y 40)."""
+    pw = np.maximum(p * w / (0.621945 + w), 1e-3) / 1000.0   # kPa
+    a = np.log(pw)
+    sobre_cero = 6.54 + 14.526 * a + 0.7389 * a**2 + 0.09486 * a**3 + 0.4569 * pw**0.1984
+    bajo_cero = 6.09 + 12.608 * a + 0.4959 * a**2
+    return np.where(sobre_cero >= 0.0, sobre_cero, bajo_cero)
+
+def entalpia(t, w):
+    """Entalpía del aire húmedo (kJ/kg aire seco, ec. 32)."""
+    t = np.asarray(t, dtype=np.float64)
+    return 1.006 * t + w * (2501.0 + 1.86 * t)
+
+def _w_saturacion_adiabatica(t, tbh, p):
+    """Razón de humedad que corresponde a un bulbo húmedo `tbh` (ec. 33 y 35)."""
+    ws = razon_humedad(tbh, 100.0, p)
+    agua = ((2501.0 - 2.326 * tbh) * ws - 1.006 * (t - tbh)) / (2501.0 + 1.86 * t - 4.186 * tbh)
+    hielo = ((2830.0 - 0.24 * tbh) * ws - 1.006 * (t - tbh)) / (2830.0 + 1.86 * t - 2.1 * tbh)
+    return np.where(tbh >= 0.0, agua, hielo)
+
+def bulbo_humedo(t, w, td, p=101325.0, iteraciones=25):
+    """Bulbo húmedo termodinámico (°C) por bisección vectorizada entre el rocío y el bulbo seco.
+
+    W(tbh) crece con tbh, así que cada hora converge sola; 25 pasos dejan un error < 1e-5 K.
+    """
+    t = np.asarray(t, dtype=np.float64)
+    bajo, alto = np.minimum(td, t), t.copy()
+    for _ in range(iteraciones):
+        medio = (bajo + alto) / 2.0
+        arriba = _w_saturacion_adiabatica(t, medio, p) > w
+        alto = np.where(arriba, medio, alto)
+        bajo = np.where(arriba, bajo, medio)
+    return (bajo + alto) / 2.0
+
+def media_exterior_predominante(t, alfa=ALFA_MEDIA_MOVIL, dias=DIAS_MEDIA_MOVIL):
+    """Media móvil exponencial de las medias diarias previas, hora a hora (año TMY cíclico)."""
+    t = np.asarray(t, dtype=np.float64)
+    n_dias = len(t) // 24
+    diaria = t[:n_dias * 24].reshape(n_dias, 24).mean(axis=1)
+    dias = min(dias, n_dias)
+    pesos = (1.0 - alfa) * alfa ** np.arange(dias)
+    pesos /= pesos.sum()
+    # Los `dias` previos a cada día, tomando el final del año antes del 1 de enero
+    previos = np.concatenate([diaria[-dias:], diaria[:-1]])
+    media = np.convolve(previos, pesos, mode='valid')[:n_dias]
+    return np.resize(np.repeat(media, 24), len(t))
+
+def confort_adaptativo(t, tpma, banda=3.5):
+    """Clase horaria FRIO / CONFORT / CALOR según ASHRAE 55 (banda 3.5 K = 80% de aceptabilidad).
+
+    La temperatura operativa se aproxima por el bulbo seco exterior (nave ventilada
+    naturalmente) y la media predominante se limita al rango de validez, 10 a 33.5 °C.
+    """
+    t_confort = 0.31 * np.clip(tpma, 10.0, 33.5) + 17.8
+    clase = np.full(np.shape(t), CONFORT, dtype=np.int8)
+    clase[t < t_confort - banda] = FRIO
+    clase[t > t_confort + banda] = CALOR
+    return clase
+
+def analisis_psicrometrico(temp_seca, hum_relativa, elevacion_m=0.0, t_consigna=T_CONSIGNA_FRIO,
+                           w_max=W_MAX_CONFORT):
+    """Estados psicrométricos horarios, carta psicrométrica y horas de carga de HVAC.
+
+    Devuelve un dict con las series horarias ('razon_humedad', 'punto_rocio', 'entalpia',
+    'bulbo_humedo', 'confort'), el histograma 'carta' (horas por celda de BORDES_T x BORDES_W)
+    y los indicadores escalares de dimensionamiento.
+    """
+    t = np.asarray(temp_seca, dtype=np.float64)
+    p = presion_atmosferica(elevacion_m)
+    w = razon_humedad(t, hum_relativa, p)
+    td = punto_rocio(w, p)
+    h = entalpia(t, w)
+    tbh = bulbo_humedo(t, w, td, p)
+    confort = confort_adaptativo(t, media_exterior_predominante(t))
+
+    carta, _, _ = np.histogram2d(np.clip(t, BORDES_T[0], BORDES_T[-1] - 1e-9),
+                                 np.clip(w * 1000.0, BORDES_W[0], BORDES_W[-1] - 1e-9),
+                                 bins=(BORDES_T, BORDES_W))
+    frio = t > t_consigna
+    deshumidificar = w > w_max
+    return {
+        'razon_humedad': w,
+        'punto_rocio': td,
+        'entalpia': h,
+        'bulbo_humedo': tbh,
+        'confort': confort,
+        'carta': carta.astype(np.int32),
+        'presion': p,
+        'horas_frio': int(frio.sum()),
+        'horas_deshumidificacion': int(deshumidificar.sum()),
+        'horas_frio_y_deshumidificacion': int((frio & deshumidificar).sum()),
+        'horas_confort': int((confort == CONFORT).sum()),
+        'horas_disconfort_calor': int((confort == CALOR).sum()),
+        'horas_disconfort_frio': int((confort == FRIO).sum()),
+        # Condiciones de diseño de refrigeración al 0.4% (percentil 99.6)
+        'bulbo_seco_diseno': float(np.percentile(t, 99.6)),
+        'bulbo_humedo_diseno': float(np.percentile(tbh, 99.6)),
+        'entalpia_diseno': float(np.percentile(h, 99.6)),
+    }
@@ -0,0 +1,343 @@
+# search_utils.py
+"""Índice de búsqueda difusa de países y estaciones (trigramas + alias ES/EN).
+
+Los nombres se normalizan una sola vez al indexar (plegado Unicode: sin acentos, casefold,
+solo alfanuméricos) y cada término se descompone en trigramas. Una consulta suma, con
+np.bincount, los postings de sus trigramas menos frecuentes y puntúa cada término con el coeficiente de Dice,
+así que no hay pasadas lineales de normalización ni llamadas de geocodificación.
+"""
+import functools
+import os
+import re
+import threading
+import unicodedata
+import numpy as np
+
+# Nombres en español, inglés y locales que los geocodificadores suelen devolver, por código ISO3
+ALIAS_PAISES = {
+    'ARE': ['Emiratos Arabes Unidos', 'United Arab Emirates', 'UAE', 'EAU'],
+    'ARG': ['Argentina'],
+    'AUS': ['Australia'],
+    'AUT': ['Austria', 'Osterreich'],
+    'BEL': ['Belgica', 'Belgium', 'Belgique', 'Belgie'],
+    'BLZ': ['Belice', 'Belize'],
+    'BOL': ['Bolivia'],
+    'BRA': ['Brasil', 'Brazil'],
+    'CAN': ['Canada'],
+    'CHE': ['Suiza', 'Switzerland', 'Schweiz', 'Suisse', 'Svizzera', 'Svizra'],
+    'CHL': ['Chile'],
+    'CHN': ['China'],
+    'CIV': ['Costa de Marfil', 'Ivory Coast', "Cote d'Ivoire"],
+    'CMR': ['Camerun', 'Cameroon'],
+    'COD': ['Republica Democratica del Congo', 'Democratic Republic of the Congo', 'DR Congo', 'RD Congo'],
+    'COG': ['Republica del Congo', 'Republic of the Congo', 'Congo Brazzaville'],
+    'COL': ['Colombia'],
+    'CRI': ['Costa Rica'],
+    'CUB': ['Cuba'],
+    'CZE': ['Republica Checa', 'Chequia', 'Czech Republic', 'Czechia'],
+    'DEU': ['Alemania', 'Germany', 'Deutschland'],
+    'DNK': ['Dinamarca', 'Denmark', 'Danmark'],
+    'DOM': ['Republica Dominicana', 'Dominican Republic'],
+    'DZA': ['Argelia', 'Algeria'],
+    'ECU': ['Ecuador'],
+    'EGY': ['Egipto', 'Egypt'],
+    'ESP': ['Espana', 'Spain'],
+    'ETH': ['Etiopia', 'Ethiopia'],
+    'FIN': ['Finlandia', 'Finland', 'Suomi'],
+    'FRA': ['Francia', 'France'],
+    'GBR': ['Reino Unido', 'United Kingdom', 'UK', 'Gran Bretana', 'Great Britain', 'Inglaterra', 'England', 'Escocia', 'Scotland', 'Gales', 'Wales'],
+    'GRC': ['Grecia', 'Greece'],
+    'GTM': ['Guatemala'],
+    'HND': ['Honduras'],
+    'HTI': ['Haiti'],
+    'HUN': ['Hungria', 'Hungary', 'Magyarorszag'],
+    'IDN': ['Indonesia'],
+    'IND': ['India', 'Republic of India', 'Bharat'],
+    'IRL': ['Irlanda', 'Ireland'],
+    'IRN': ['Iran'],
+    'IRQ': ['Irak', 'Iraq'],
+    'ITA': ['Italia', 'Italy'],
+    'JAM': ['Jamaica'],
+    'JOR': ['Jordania', 'Jordan'],
+    'JPN': ['Japon', 'Japan'],
+    'KEN': ['Kenia', 'Kenya'],
+    'KGZ': ['Kirguistan', 'Kyrgyzstan', 'Kyrgyz Republic'],
+    'KOR': ['Corea del Sur', 'South Korea', 'Korea', 'Republic of Korea', 'Republica de Corea'],
+    'LBN': ['Libano', 'Lebanon'],
+    'MAR': ['Marruecos', 'Morocco'],
+    'MEX': ['Mexico', 'Estados Unidos Mexicanos'],
+    'MYS': ['Malasia', 'Malaysia'],
+    'NIC': ['Nicaragua'],
+    'NLD': ['Paises Bajos', 'Holanda', 'Netherlands', 'Holland', 'Nederland'],
+    'NOR': ['Noruega', 'Norway', 'Norge'],
+    'NZL': ['Nueva Zelanda', 'New Zealand'],
+    'PAK': ['Pakistan'],
+    'PAN': ['Panama'],
+    'PER': ['Peru'],
+    'PHL': ['Filipinas', 'Philippines'],
+    'POL': ['Polonia', 'Poland', 'Polska'],
+    'PRI': ['Puerto Rico'],
+    'PRK': ['Corea del Norte', 'North Korea', "Democratic People's Republic of Korea"],
+    'PRT': ['Portugal'],
+    'PRY': ['Paraguay'],
+    'QAT': ['Catar', 'Qatar'],
+    'ROU': ['Rumania', 'Romania'],
+    'RUS': ['Rusia', 'Russia', 'Russian Federation'],
+    'SAU': ['Arabia Saudita', 'Arabia Saudi', 'Saudi Arabia'],
+    'SGP': ['Singapur', 'Singapore'],
+    'SLV': ['El Salvador'],
+    'SVK': ['Eslovaquia', 'Slovakia', 'Slovak Republic', 'Slovensko'],
+    'SWE': ['Suecia', 'Sweden', 'Sverige'],
+    'SYR': ['Siria', 'Syria'],
+    'THA': ['Tailandia', 'Thailand'],
+    'TUN': ['Tunez', 'Tunisia'],
+    'TUR': ['Turquia', 'Turkey', 'Turkiye'],
+    'UKR': ['Ucrania', 'Ukraine'],
+    'URY': ['Uruguay'],
+    'USA': ['Estados Unidos', 'Estados Unidos de America', 'EEUU', 'EE UU', 'United States', 'United States of America', 'USA', 'US'],
+    'VEN': ['Venezuela'],
+    'VNM': ['Vietnam', 'Viet Nam'],
+    'ZAF': ['Sudafrica', 'South Africa'],
+}
+
+_NO_ALFANUM = re.compile(r'[^0-9a-z]+')
+
+# Postings que una consulta suma con bincount; los trigramas más repetidos se comprueban
+# después solo en los mejores candidatos, así el costo no crece con el tamaño del índice
+PRESUPUESTO_POSTINGS = 5000
+
+@functools.lru_cache(maxsize=65536)
+def plegar(texto):
+    """Normaliza para búsqueda: quita diacríticos (NFKD), casefold y deja solo [a-z0-9 ]."""
+    if not texto:
+        return ""
+    sin_marcas = ''.join(c for c in unicodedata.normalize('NFKD', texto) if not unicodedata.combining(c))
+    return _NO_ALFANUM.sub(' ', sin_marcas.casefold()).strip()
+
+def trigramas(texto_plegado):
+    """Trigramas de cada palabra con relleno de bordes (' ma', 'mad', ..., 'id ').
+
+    Sin el trigrama de una sola letra ('  m'), que aparece en demasiados términos para discriminar.
+    """
+    grams = set()
+    for palabra in texto_plegado.split():
+        p = f" {palabra} "
+        grams.update(p[i:i + 3] for i in range(len(p) - 2))
+    return grams
+
+def palabras_cubiertas(consulta_plegada, termino, minimo=0.5):
+    """True si cada palabra de la consulta tiene en `termino` una palabra con Dice >= `minimo`.
+
+    Evita que una sola palabra común ("Republic") arrastre la coincidencia con otro país.
+    """
+    palabras = [trigramas(p) for p in termino.split()]
+    for palabra in consulta_plegada.split():
+        g = trigramas(palabra)
+        if not any(2.0 * len(g & t) / (len(g) + len(t)) >= minimo for t in palabras):
+            return False
+    return True
+
+class IndiceBusqueda:
+    """Postings de trigramas -> términos; cada término apunta a una entrada (país o estación)."""
+
+    def __init__(self):
+        self.entradas = []            # dicts con 'tipo', 'nombre', 'clave' y opcionalmente URL_ZIP/lat/lon
+        self._terminos = []           # texto plegado de cada término
+        self._termino_entrada = []    # índice de entrada de cada término
+        self._n_gramas = []           # nº de trigramas de cada término
+        self._termino_tipo = []       # 0 = país, 1 = estación (filtros vectorizados)
+        self._termino_clave = []      # id de la clave de país de cada término
+        self._claves = {}             # clave de país -> id
+        self._postings = {}           # trigrama -> lista de términos
+        self._exactos = {}            # texto plegado -> entrada (resolución O(1) de alias exactos)
+        self._por_url = {}            # URL_ZIP -> entrada
+        self._arrays = None
+        self._coordenadas = None      # (ids, lat, lon) de las estaciones con coordenadas conocidas
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entradas)
+
+    def agregar(self, entrada, nombres):
+        """Indexa `entrada` bajo cada uno de sus `nombres` y devuelve su id."""
+        with self._lock:
+            eid = len(self.entradas)
+            self.entradas.append(entrada)
+            for nombre in nombres:
+                termino = plegar(nombre)
+                if not termino:
+                    continue
+                self._exactos.setdefault(termino, eid)
+                tid = len(self._terminos)
+                self._terminos.append(termino)
+                self._termino_entrada.append(eid)
+                grams = trigramas(termino)
+                self._n_gramas.append(len(grams))
+                self._termino_tipo.append(entrada['tipo'] == 'estacion')
+                self._termino_clave.append(self._claves.setdefault(entrada['clave'], len(self._claves)))
+                for g in grams:
+                    self._postings.setdefault(g, []).append(tid)
+            self._arrays = None
+            self._coordenadas = None
+            return eid
+
+    def agregar_estaciones(self, estaciones, clave_pais):
+        """Indexa filas de listar_estaciones (sin duplicar URLs ya conocidas)."""
+        for est in estaciones:
+            if est['URL_ZIP'] in self._por_url:
+                continue
+            # 'espejo': coordenadas leídas del EPW espejado (no de una geocodificación en línea)
+            entrada = {'tipo': 'estacion', 'nombre': est['Estación'], 'clave': clave_pais,
+                       'URL_ZIP': est['URL_ZIP'], 'lat': est.get('lat'), 'lon': est.get('lon'),
+                       'espejo': bool(est.get('espejo'))}
+            self._por_url[est['URL_ZIP']] = entrada
+            self.agregar(entrada, [est['City_Search'], est['Estación']])
+
+    def registrar_coordenadas(self, url_zip, lat, lon):
+        """Guarda coordenadas conocidas (EPW o geocodificación previa) de una estación indexada."""
+        entrada = self._por_url.get(url_zip)
+        if entrada is not None:
+            entrada['lat'], entrada['lon'] = lat, lon
+            self._coordenadas = None
+
+    def cercanas(self, lat, lon, limite=5):
+        """Estaciones espejadas más cercanas a (lat, lon): lista de (km, entrada).
+
+        Solo cuentan las coordenadas del EPW del espejo: las geocodificadas en búsquedas en línea
+        cubren unas pocas estaciones por país y harían pasar por cercana a la única conocida.
+        Distancia de gran círculo vectorizada (sin red).
+        """
+        with self._lock:
+            if self._coordenadas is None:
+                ids = [i for i, e in enumerate(self.entradas)
+                       if e['tipo'] == 'estacion' and e.get('espejo') and e.get('lat') is not None]
+                self._coordenadas = (np.asarray(ids, dtype=np.int64),
+                                     np.radians([float(self.entradas[i]['lat']) for i in ids]),
+                                     np.radians([float(self.entradas[i]['lon']) for i in ids]))
+            ids, lats, lons = self._coordenadas
+        if len(ids) == 0:
+            return []
+        la, lo = np.radians(lat), np.radians(lon)
+        a = np.sin((lats - la) / 2) ** 2 + np.cos(la) * np.cos(lats) * np.sin((lons - lo) / 2) ** 2
+        km = 2 * 6371.0088 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+        top = np.argpartition(km, limite)[:limite] if len(km) > limite else np.arange(len(km))
+        top = top[np.argsort(km[top])]
+        return [(float(km[i]), self.entradas[ids[i]]) for i in top]
+
+    def exacto(self, nombre, tipo=None):
+        eid = self._exactos.get(plegar(nombre))
+        if eid is None or (tipo and self.entradas[eid]['tipo'] != tipo):
+            return None
+        return self.entradas[eid]
+
+    def _preparar(self):
+        with self._lock:
+            if self._arrays is None:
+                self._arrays = (
+                    {g: np.asarray(t, dtype=np.int32) for g, t in self._postings.items()},
+                    list(self._termino_entrada),
+                    np.asarray(self._n_gramas, dtype=np.float32),
+                    np.asarray(self._termino_tipo, dtype=bool),
+                    np.asarray(self._termino_clave, dtype=np.int32),
+                )
+            return self._arrays
+
+    def buscar(self, consulta, limite=10, tipo=None, clave=None, minimo=0.3, todas_palabras=False):
+        """Entradas ordenadas por similitud (Dice de trigramas, 1.0 = término idéntico).
+
+        Devuelve una lista de (puntaje, entrada); `tipo` y `clave` filtran por 'pais'/'estacion'
+        y por país. Los términos que contienen la consulta como prefijo de palabra se bonifican.
+        Con `todas_palabras` cada palabra de la consulta debe parecerse a alguna del término.
+        """
+        q = plegar(consulta)
+        grams = trigramas(q)
+        if not grams or not self._terminos:
+            return []
+        postings, termino_entrada, n_gramas, termino_tipo, termino_clave = self._preparar()
+        listas = sorted((postings[g] for g in grams if g in postings), key=len)
+        if not listas:
+            return []
+        # Semilla: los trigramas menos frecuentes se suman enteros mientras quepan en el
+        # presupuesto; el resto se cuenta después solo en los candidatos que pasen el corte
+        acumulado = np.cumsum([len(l) for l in listas])
+        n_semilla = int(np.searchsorted(acumulado, PRESUPUESTO_POSTINGS, 'right'))
+        semilla, resto = listas[:n_semilla], listas[n_semilla:]
+        if resto:
+            # Del primer trigrama que no cabe se suman sus primeros términos (consulta poco
+            # específica: empatan en los trigramas raros) y su cola queda para el recuento
+            corte = PRESUPUESTO_POSTINGS - (int(acumulado[n_semilla - 1]) if n_semilla else 0)
+            semilla, resto = semilla + [resto[0][:corte]], [resto[0][corte:]] + resto[1:]
+            resto = [l for l in resto if len(l)]
+        candidatos, comunes = np.unique(np.concatenate(semilla), return_counts=True)
+        if tipo:
+            filtro = termino_tipo[candidatos] == (tipo == 'estacion')
+            candidatos, comunes = candidatos[filtro], comunes[filtro]
+        if clave:
+            filtro = termino_clave[candidatos] == self._claves.get(clave, -1)
+            candidatos, comunes = candidatos[filtro], comunes[filtro]
+        # Cota optimista: el término podría tener además todos los trigramas frecuentes
+        puntajes = 2.0 * (comunes + len(resto)) / (n_gramas[candidatos] + len(grams))
+        # La bonificación máxima es +0.2: lo que queda por debajo no puede alcanzar el mínimo
+        viables = puntajes + 0.2 >= minimo
+        candidatos, comunes, puntajes = candidatos[viables], comunes[viables], puntajes[viables]
+
+        # Solo los mejores por la cota pasan al recuento exacto y a la bonificación (en Python)
+        tope = limite * 20
+        if len(candidatos) > tope:
+            top = np.argpartition(-puntajes, tope)[:tope]
+            candidatos, comunes = candidatos[top], comunes[top]
+        for lista in resto:
+            # Los postings están ordenados por id de término
+            pos = np.minimum(np.searchsorted(lista, candidatos), len(lista) - 1)
+            comunes = comunes + (lista[pos] == candidatos)
+        puntajes = 2.0 * comunes / (n_gramas[candidatos] + len(grams))
+
+        mejores = {}
+        for tid, p in zip(candidatos.tolist(), puntajes.tolist()):
+            termino = self._terminos[tid]
+            if todas_palabras and not palabras_cubiertas(q, termino):
+                continue
+            if termino == q:
+                p = 1.0
+            elif (' ' + termino).find(' ' + q) >= 0:
+                p = min(0.99, p + 0.2)
+            eid = termino_entrada[tid]
+            if p >= minimo and p > mejores.get(eid, 0.0):
+                mejores[eid] = p
+        orden = sorted(mejores.items(), key=lambda kv: -kv[1])[:limite]
+        return [(p, self.entradas[eid]) for eid, p in orden]
+
+def construir_indice(mapping, mirror_dir=None):
+    """Índice con todos los países del mapping (nombre, código, alias) y las estaciones del espejo."""
+    indice = IndiceBusqueda()
+    principal = {}
+    for clave in mapping:
+        codigo, _, nombre = clave.partition('_')
+        # Las variantes (BRA_Brazil_BrazFuture, CAN_Canada_Future) no roban el alias del país
+        if codigo not in principal or len(clave) < len(principal[codigo]):
+            principal[codigo] = clave
+    for clave in sorted(mapping, key=lambda c: c not in principal.values()):
+        codigo, _, nombre = clave.partition('_')
+        nombres = [nombre.replace('_', ' '), clave]
+        if principal.get(codigo) == clave:
+            nombres += [codigo] + ALIAS_PAISES.get(codigo, [])
+        indice.agregar({'tipo': 'pais', 'nombre': nombre.replace('_', ' ') or clave, 'clave': clave}, nombres)
+
+    if mirror_dir and os.path.isdir(mirror_dir):
+        _indexar_mirror(indice, mapping, mirror_dir)
+    return indice
+
+def _indexar_mirror(indice, mapping, mirror_dir):
+    from weather_utils import archivo_en_mirror, cargar_clima_compacto, listar_estaciones, ruta_clima_mirror
+    for clave, country_url in mapping.items():
+        local = archivo_en_mirror(country_url, mirror_dir)
+        if not local:
+            continue
+        with open(local, 'r', encoding='utf-8', errors='replace') as f:
+            estaciones = listar_estaciones(f.read(), country_url)
+        for est in estaciones:
+            clima = cargar_clima_compacto(ruta_clima_mirror(est['URL_ZIP'], mirror_dir), mmap=True)
+            if clima:
+                est['lat'], est['lon'] = clima['metadata']['lat'], clima['metadata']['lon']
+                est['espejo'] = True
+        indice.agregar_estaciones(estaciones, clave)
@@ -0,0 +1,119 @@
+# store_utils.py
+"""Almacén de clima compartido por todas las sesiones del proceso (solo lectura).
+
+Cada estación se abre una sola vez como memmap de su clima compacto (.npy del espejo o de la
+caché local), así que las sesiones del proceso comparten el mismo dict de series y los
+distintos procesos de la app comparten las mismas páginas a través de la caché del sistema
+operativo. Una sesión guarda solo un HandleClima (clave + referencia): cuenta como una
+referencia hasta que se libera o se recolecta con la sesión. Las estaciones sin referencias
+quedan en un LRU acotado y después se desalojan, de modo que la memoria depende del número
+de estaciones distintas en uso y no del número de usuarios.
+"""
+import collections
+import os
+import threading
+import weakref
+from collections.abc import Mapping
+
+from weather_utils import cargar_clima_compacto, obtener_clima, ruta_clima_cache, ruta_clima_compacto
+
+# Estaciones sin sesiones que se mantienen mapeadas por si vuelven a pedirse
+MAX_SIN_USO = int(os.environ.get("SKYCALC_STORE_MAX_SIN_USO", 16))
+
+def clave_estacion(url_zip):
+    """Hash de la estación (el mismo que nombra su clima en la caché local)."""
+    return os.path.basename(ruta_clima_cache(url_zip))
+
+class _Entrada:
+    def __init__(self, datos):
+        self.datos = datos
+        self.refs = 0
+
+class HandleClima(Mapping):
+    """Referencia de una sesión a un clima del almacén; se usa como el dict de series de siempre."""
+
+    def __init__(self, almacen, clave, url, datos):
+        self.clave = clave
+        self.url = url
+        self._datos = datos
+        # Si la sesión desaparece sin liberar, la referencia se devuelve al recolectarla
+        self._finalizador = weakref.finalize(self, almacen._soltar, clave)
+
+    def liberar(self):
+        self._finalizador()
+
+    def __getitem__(self, k):
+        return self._datos[k]
+
+    def __iter__(self):
+        return iter(self._datos)
+
+    def __len__(self):
+        return len(self._datos)
+
+class AlmacenClima:
+    def __init__(self, max_sin_uso=MAX_SIN_USO):
+        self.max_sin_uso = max_sin_uso
+        self._entradas = collections.OrderedDict()  # clave -> _Entrada, la menos usada primero
+        # Reentrante: un finalizador de HandleClima puede saltar (GC) con el lock ya tomado
+        self._lock = threading.RLock()
+
+    def abrir(self, url_zip, obtener=obtener_clima):
+        """Handle del clima de la estación, o None si no se pudo obtener.
+
+        Si no hay clima compacto en disco se llama a `obtener(url_zip)` (descarga y cachea;
+        la app pasa PrefetchClima.obtener para aprovechar una precarga en curso).
+        """
+        clave = clave_estacion(url_zip)
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                return self._referenciar(clave, entrada, url_zip)
+
+        datos_memoria = None
+        ruta_base = ruta_clima_compacto(url_zip)
+        if ruta_base is None:
+            datos_memoria = obtener(url_zip)
+            if not datos_memoria:
+                return None
+            ruta_base = ruta_clima_compacto(url_zip)
+        # Sin caché escribible el clima queda en memoria, pero igualmente una sola copia por proceso
+        datos = cargar_clima_compacto(ruta_base, mmap=True) if ruta_base else datos_memoria
+        if not datos:
+            return None
+
+        with self._lock:
+            # Otra sesión pudo abrir la misma estación mientras tanto: se conserva la primera
+            entrada = self._entradas.setdefault(clave, _Entrada(datos))
+            handle = self._referenciar(clave, entrada, url_zip)
+            self._desalojar()
+            return handle
+
+    def _referenciar(self, clave, entrada, url_zip):
+        entrada.refs += 1
+        self._entradas.move_to_end(clave)
+        return HandleClima(self, clave, url_zip, entrada.datos)
+
+    def _soltar(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and entrada.refs > 0:
+                entrada.refs -= 1
+                self._desalojar()
+
+    def _desalojar(self):
+        sin_uso = [c for c, e in list(self._entradas.items()) if e.refs == 0]
+        for clave in sin_uso[:max(0, len(sin_uso) - self.max_sin_uso)]:
+            # Al soltar el dict se cierra el memmap; las páginas las recupera el sistema
+            self._entradas.pop(clave, None)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'estaciones': len(self._entradas),
+                'referencias': sum(e.refs for e in self._entradas.values()),
+                'bytes': sum(getattr(v, 'nbytes', 0) for e in self._entradas.values() for v in e.datos.values()),
+            }
+
+# Almacén único del proceso (todas las sesiones de Streamlit corren en él)
+ALMACEN = AlmacenClima()
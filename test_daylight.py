@@ -0,0 +1,51 @@
+# test_daylight.py
+import numpy as np
+
+import daylight_utils
+from daylight_utils import _tamanos_bloque, factor_geometrico, malla_sensores, metricas_anuales
+from layout_utils import centros_domos
+
+def _caso_pequeno():
+    contorno, centros = centros_domos(30, 40, 0.04, 1.3, 2.2)
+    sensores = malla_sensores(contorno, 2.0)
+    ext = np.clip(np.sin((np.arange(8760) % 24 - 6) / 12 * np.pi), 0, None) * 50000
+    ext *= np.random.default_rng(1).uniform(0.2, 1.0, 8760)  # días nublados
+    return sensores, centros, ext
+
+def _k_fuerza_bruta(sensores, centros, h, area):
+    d2 = ((sensores[:, None, :].astype(float) - centros[None]) ** 2).sum(-1)
+    return area / np.pi * (h * h / (h * h + d2) ** 2).sum(1)
+
+def test_factor_geometrico_por_bloques_igual_a_fuerza_bruta():
+    sensores, centros, _ = _caso_pequeno()
+    k = factor_geometrico(sensores, centros, 7.2, 1.3 * 2.2, memoria_max_mb=0.01)
+    np.testing.assert_allclose(k, _k_fuerza_bruta(sensores, centros, 7.2, 1.3 * 2.2), rtol=1e-5)
+
+def test_pool_de_procesos_igual_a_serie(monkeypatch):
+    sensores, centros, _ = _caso_pequeno()
+    serie = factor_geometrico(sensores, centros, 7.2, 2.86, procesos=1)
+    monkeypatch.setattr(daylight_utils, 'PARES_MIN_POOL', 0)
+    np.testing.assert_allclose(factor_geometrico(sensores, centros, 7.2, 2.86, procesos=2), serie, rtol=1e-6)
+    # El pool (spawn, sin fork del servidor multihilo) se reutiliza entre simulaciones
+    pool = daylight_utils._POOL
+    assert pool._mp_context.get_start_method() == 'spawn'
+    np.testing.assert_allclose(factor_geometrico(sensores, centros, 7.2, 2.86, procesos=2), serie, rtol=1e-6)
+    assert daylight_utils._POOL is pool
+
+def test_metricas_iguales_al_tensor_horario_completo():
+    sensores, centros, ext = _caso_pequeno()
+    k = factor_geometrico(sensores, centros, 7.2, 2.86)
+    m = metricas_anuales(k, ext, vlt=0.67, eficiencia_pozo=0.85)
+
+    ocupadas = daylight_utils.horas_ocupadas()
+    tensor = np.outer(k, ext[ocupadas] * 0.67 * 0.85)  # sensores x horas, solo en el test
+    autonomia = (tensor >= 300).mean(axis=1)
+    np.testing.assert_allclose(m['autonomia'], autonomia)
+    assert m['sda'] == (autonomia >= 0.5).mean()
+    np.testing.assert_allclose(m['uniformidad'], np.median(tensor.min(0) / tensor.mean(0)), rtol=1e-6)
+    assert m['horas_ocupadas'] == 3650
+
+def test_bloques_respetan_el_techo_de_memoria():
+    for memoria_mb in (1, 16, 256):
+        bloque_s, bloque_d = _tamanos_bloque(50_000, memoria_mb)
+        assert 4 * 4 * bloque_s * bloque_d <= memoria_mb * 2**20
@@ -0,0 +1,85 @@
+# test_layout.py
+import time
+import numpy as np
+
+from layout_utils import (HashSegmentos, area_poligono, generar_layout_domos, layout_rectangular,
+                          parsear_poligonos, puntos_en_poligono)
+
+PLANTA_L = [(0, 0), (200, 0), (200, 80), (80, 80), (80, 200), (0, 200)]
+PATIO = [(20, 20), (50, 20), (50, 50), (20, 50)]
+HVAC = [(100, 10), (120, 10), (120, 30), (100, 30)]
+
+def test_punto_en_poligono_en_L():
+    px, py = np.array([10.0, 150.0, 150.0, 40.0]), np.array([150.0, 150.0, 40.0, 79.0])
+    assert puntos_en_poligono(px, py, PLANTA_L).tolist() == [True, False, True, True]
+
+def test_hash_de_holgura_coincide_con_fuerza_bruta():
+    rng = np.random.default_rng(0)
+    px, py = rng.uniform(-10, 210, 5000), rng.uniform(-10, 210, 5000)
+    seg = np.array([[0, 0, 200, 0], [200, 0, 80, 200], [80, 200, 0, 0]], dtype=float)
+    cerca = HashSegmentos(seg, 3.0).demasiado_cerca(px, py)
+
+    ax, ay, bx, by = seg.T
+    t = np.clip(((px[:, None] - ax) * (bx - ax) + (py[:, None] - ay) * (by - ay)) / ((bx - ax) ** 2 + (by - ay) ** 2), 0, 1)
+    d = np.hypot(px[:, None] - ax - t * (bx - ax), py[:, None] - ay - t * (by - ay)).min(axis=1)
+    assert np.array_equal(cerca, d < 3.0)
+
+def test_layout_en_L_con_patio_y_exclusion():
+    r = generar_layout_domos(PLANTA_L, 0.04, 1.3, 2.5, huecos=[PATIO], exclusiones=[HVAC], holgura=0.5)
+    c = r['centros']
+    assert r['area_techo'] == area_poligono(PLANTA_L) - area_poligono(PATIO)
+    assert 0.04 <= r['sfr_real'] <= 0.04 * 1.03
+    assert puntos_en_poligono(c[:, 0], c[:, 1], PLANTA_L).all()
+    assert not puntos_en_poligono(c[:, 0], c[:, 1], PATIO).any()
+    # Holgura: ningún centro a menos de semidiagonal + 0.5 m de la zona HVAC
+    radio = np.hypot(1.3, 2.5) / 2 + 0.5
+    dentro_ampliada = (c[:, 0] > 100 - radio) & (c[:, 0] < 120 + radio) & (c[:, 1] > 10 - radio) & (c[:, 1] < 30 + radio)
+    assert not dentro_ampliada.any() or np.all(np.hypot(np.clip(c[dentro_ampliada, 0], 100, 120) - c[dentro_ampliada, 0],
+                                                        np.clip(c[dentro_ampliada, 1], 10, 30) - c[dentro_ampliada, 1]) >= radio)
+
+def test_sfr_real_sigue_al_objetivo():
+    # Contorno de ejemplo de la barra lateral con un patio y una zona HVAC de 10 x 10 m
+    planta = [(0, 0), (120, 0), (120, 40), (40, 40), (40, 100), (0, 100)]
+    patio, hvac = [(10, 50), (20, 50), (20, 60), (10, 60)], [(80, 10), (90, 10), (90, 20), (80, 20)]
+    for huecos, exclusiones in (([], []), ([patio], [hvac])):
+        n_anterior = 0
+        for sfr in np.arange(0.02, 0.1001, 0.005):
+            r = generar_layout_domos(planta, sfr, 1.327, 2.546, huecos=huecos, exclusiones=exclusiones)
+            # La cuadrícula regular redondea a filas/columnas enteras: unos pocos domos de más
+            assert sfr <= r['sfr_real'] <= sfr * 1.05, (sfr, r['sfr_real'])
+            # Cada paso del deslizador cambia el número de domos
+            assert len(r['centros']) > n_anterior
+            n_anterior = len(r['centros'])
+
+def test_layout_sigue_siendo_una_cuadricula_regular():
+    planta = [(0, 0), (120, 0), (120, 40), (40, 40), (40, 100), (0, 100)]
+    for sfr in (0.02, 0.03, 0.05, 0.08):
+        r = generar_layout_domos(planta, sfr, 1.327, 2.546)
+        c, (px, py) = r['centros'], r['paso']
+        # Todas las coordenadas caen en una retícula de paso fijo...
+        for v, paso in ((c[:, 0], px), (c[:, 1], py)):
+            k = (v - v.min()) / paso
+            assert np.allclose(k, np.round(k), atol=1e-6)
+        # ...y sin zonas excluidas no hay huecos sueltos dentro de una fila o columna
+        for eje, paso in ((0, px), (1, py)):
+            for fila in np.unique(np.round(c[:, 1 - eje], 6)):
+                v = np.sort(c[np.isclose(c[:, 1 - eje], fila), eje])
+                assert np.allclose(np.diff(v), paso)
+        assert max(px, py) / min(px, py) <= 1.5
+
+def test_techo_grande_en_menos_de_un_segundo():
+    planta = [(0, 0), (1200, 0), (1200, 700), (500, 700), (500, 1200), (0, 1200)]
+    inicio = time.perf_counter()
+    r = generar_layout_domos(planta, 0.12, 1.3, 1.3)
+    assert time.perf_counter() - inicio < 1.0
+    assert r['candidatos'] > 100_000
+    assert r['sfr_real'] >= 0.12
+
+def test_layout_rectangular_original():
+    c = layout_rectangular(50, 100, 0.04, 1.3, 2.2)
+    assert len(c) == 72
+    assert c.min(axis=0).tolist() == [50 / 6 / 2, 100 / 12 / 2]
+
+def test_parsear_poligonos():
+    texto = "0,0\n10,0\n10,10\n\n2;2\n4;2\n4;4\n"
+    assert parsear_poligonos(texto) == [[(0, 0), (10, 0), (10, 10)], [(2, 2), (4, 2), (4, 4)]]
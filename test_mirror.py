@@ -0,0 +1,220 @@
+# test_mirror.py
+import io
+import os
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+import weather_utils
+from weather_utils import (archivo_en_mirror, cargar_clima_compacto, escribir_sidecar,
+                           guardar_clima_compacto, ruta_clima_mirror, ruta_en_mirror)
+import mirror_utils
+from mirror_utils import archivo_en_mirror_local, descargar_reanudable, espejar_paises, resolver_paises
+
+URL_ZIP = ("https://climate.onebuilding.org/WMO_Region_4_North_and_Central_America/MEX_Mexico/"
+           "QRO_Queretaro/MEX_QRO_Queretaro.Intl.AP.766250_TMYx.zip")
+
+def _clima_falso():
+    horas = np.arange(8760, dtype=float)
+    data = {k: (horas % 24).tolist() for k in weather_utils.VARIABLES_CLIMA}
+    data['metadata'] = {'ciudad': 'Queretaro', 'pais': 'MEX', 'lat': 20.6, 'lon': -100.4, 'tz': -6, 'elevacion': 1800}
+    return data
+
+def test_resolver_paises():
+    assert resolver_paises(['Mexico']) == ['MEX_Mexico']
+    assert resolver_paises(['esp', 'ESP_Spain']) == ['ESP_Spain']
+    assert len(resolver_paises(['WMO_Region_7'])) == 3
+    with pytest.raises(ValueError):
+        resolver_paises(['Atlantida'])
+
+def test_clima_compacto_roundtrip(tmp_path):
+    ruta_base = ruta_clima_mirror(URL_ZIP, str(tmp_path))
+    assert ruta_base.endswith(os.path.join('QRO_Queretaro', 'MEX_QRO_Queretaro.Intl.AP.766250_TMYx'))
+    guardar_clima_compacto(_clima_falso(), ruta_base)
+
+    data = cargar_clima_compacto(ruta_base, mmap=True)
+    assert data['metadata']['ciudad'] == 'Queretaro'
+    assert data['temp_seca'].dtype == np.float32
+    assert len(data['nubes']) == 8760 and data['nubes'][23] == 23.0
+
+def test_sidecar_detecta_archivo_incompleto(tmp_path):
+    path = ruta_en_mirror(URL_ZIP, str(tmp_path))
+    os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as f:
+        f.write(b'x' * 100)
+    assert archivo_en_mirror(URL_ZIP, str(tmp_path)) is None
+
+    escribir_sidecar(path)
+    assert archivo_en_mirror(URL_ZIP, str(tmp_path)) == path
+    assert archivo_en_mirror_local(path)
+
+    with open(path, 'ab') as f:
+        f.write(b'y')
+    assert archivo_en_mirror(URL_ZIP, str(tmp_path)) is None
+    assert not archivo_en_mirror_local(path)
+
+def test_obtener_clima_cachea_en_formato_compacto(tmp_path, monkeypatch):
+    monkeypatch.setattr(weather_utils, 'MIRROR_DIR', str(tmp_path / 'mirror'))
+    monkeypatch.setattr(weather_utils, 'CACHE_DIR', str(tmp_path / 'cache'))
+    descargas = []
+    monkeypatch.setattr(weather_utils, 'descargar_y_extraer_epw', lambda url, cancelado=None: descargas.append(url) or str(tmp_path / 'x.epw'))
+    monkeypatch.setattr(weather_utils, 'procesar_datos_clima', lambda path: _clima_falso())
+
+    assert not weather_utils.clima_en_cache(URL_ZIP)
+    primera = weather_utils.obtener_clima(URL_ZIP)
+    assert weather_utils.clima_en_cache(URL_ZIP)
+    segunda = weather_utils.obtener_clima(URL_ZIP)
+    assert descargas == [URL_ZIP]
+    assert segunda['temp_seca'].dtype == np.float32
+    assert np.array_equal(primera['temp_seca'], segunda['temp_seca'])
+
+def test_estaciones_cercanas_desde_el_espejo_sin_red(monkeypatch):
+    from search_utils import IndiceBusqueda
+    indice = IndiceBusqueda()
+    indice.agregar_estaciones([
+        {'Estación': 'ESP_MD_Madrid.AP_TMYx', 'City_Search': 'Madrid', 'URL_ZIP': 'https://x/madrid.zip',
+         'lat': 40.47, 'lon': -3.56, 'espejo': True},
+        {'Estación': 'ESP_CM_Toledo_TMYx', 'City_Search': 'Toledo', 'URL_ZIP': 'https://x/toledo.zip',
+         'lat': 39.88, 'lon': -4.05, 'espejo': True},
+        {'Estación': 'ESP_CT_Barcelona.AP_TMYx', 'City_Search': 'Barcelona', 'URL_ZIP': 'https://x/bcn.zip',
+         'lat': 41.30, 'lon': 2.08, 'espejo': True},
+        {'Estación': 'MEX_QRO_Queretaro.AP_TMYx', 'City_Search': 'Queretaro', 'URL_ZIP': URL_ZIP,
+         'lat': 20.6, 'lon': -100.4, 'espejo': True},
+    ], 'ESP_Spain')
+    # Coordenadas geocodificadas en una búsqueda en línea anterior: no cuentan como espejo
+    indice.agregar_estaciones([{'Estación': 'ESP_VC_Valencia.AP_TMYx', 'City_Search': 'Valencia',
+                                'URL_ZIP': 'https://x/valencia.zip'}], 'ESP_Spain')
+    indice.registrar_coordenadas('https://x/valencia.zip', 39.49, -0.48)
+    monkeypatch.setattr(weather_utils, '_INDICE', indice)
+    geocodificaciones = []
+    # Sin red la geocodificación inversa falla; antes se caía a México
+    monkeypatch.setattr(weather_utils, 'get_location_info', lambda lat, lon: geocodificaciones.append(lat) or (None, None))
+
+    df = weather_utils.obtener_estaciones_cercanas(40.4168, -3.7038, top_n=2)
+    assert df['URL_ZIP'].tolist() == ['https://x/madrid.zip', 'https://x/toledo.zip']
+    assert 10 < df['distancia_km'].iloc[0] < 20
+    assert geocodificaciones == []  # el espejo cubre el sitio: sin red
+
+    # Con menos de top_n espejadas dentro del radio se intenta la red; si falla, solo las cercanas
+    df = weather_utils.obtener_estaciones_cercanas(39.47, -0.38, top_n=3)
+    assert geocodificaciones == [39.47]
+    assert 'https://x/valencia.zip' not in df['URL_ZIP'].tolist()
+    assert (df['distancia_km'] <= weather_utils.RADIO_ESPEJO_KM).all()
+
+    # Fuera de la cobertura del espejo y sin red: nada, nunca el clima de otro continente
+    assert weather_utils.obtener_estaciones_cercanas(-33.9, 18.4, top_n=1).empty
+
+def _zip_estacion(nombre, tam=200_000):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_STORED) as z:
+        z.writestr(nombre + '.epw', np.random.default_rng(len(nombre)).bytes(tam))
+    return buf.getvalue()
+
+@pytest.fixture
+def servidor():
+    """Servidor HTTP local: sirve `archivos` (ruta -> bytes), con o sin soporte de Range."""
+    estado = {'archivos': {}, 'range': True, 'demora': 0.0, 'peticiones': [], 'activas': 0, 'max_activas': 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            with lock:
+                estado['peticiones'].append((self.path, self.headers.get('Range')))
+                estado['activas'] += 1
+                estado['max_activas'] = max(estado['max_activas'], estado['activas'])
+            try:
+                time.sleep(estado['demora'])
+                cuerpo = estado['archivos'].get(self.path)
+                if cuerpo is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                rango = self.headers.get('Range')
+                if rango and estado['range']:
+                    inicio = int(rango.split('=')[1].rstrip('-'))
+                    if inicio >= len(cuerpo):
+                        self.send_response(416)
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    cuerpo = cuerpo[inicio:]
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Length', str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+            finally:
+                with lock:
+                    estado['activas'] -= 1
+
+    srv = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    estado['base'] = f"http://127.0.0.1:{srv.server_address[1]}"
+    yield estado
+    srv.shutdown()
+    srv.server_close()
+
+@pytest.mark.parametrize('acepta_range', [True, False])
+def test_descarga_reanuda_part(servidor, tmp_path, acepta_range):
+    datos = _zip_estacion('MEX_QRO_Queretaro')
+    servidor['archivos']['/a/MEX_QRO_Queretaro_TMYx.zip'] = datos
+    servidor['range'] = acepta_range
+    destino = str(tmp_path / 'MEX_QRO_Queretaro_TMYx.zip')
+    with open(destino + '.part', 'wb') as f:
+        f.write(datos[:70_000])
+
+    assert descargar_reanudable(servidor['base'] + '/a/MEX_QRO_Queretaro_TMYx.zip', destino)
+    # 206: se añade a lo ya bajado; 200: el servidor reenvía todo y el .part se sobrescribe
+    assert servidor['peticiones'] == [('/a/MEX_QRO_Queretaro_TMYx.zip', 'bytes=70000-')]
+    assert open(destino, 'rb').read() == datos
+    assert not os.path.exists(destino + '.part') and archivo_en_mirror_local(destino)
+
+def test_descarga_416_con_part_completo(servidor, tmp_path):
+    datos = _zip_estacion('ESP_MD_Madrid')
+    servidor['archivos']['/b.zip'] = datos
+    destino = str(tmp_path / 'b.zip')
+    with open(destino + '.part', 'wb') as f:
+        f.write(datos)
+
+    assert descargar_reanudable(servidor['base'] + '/b.zip', destino)
+    # El servidor responde 416 (nada más que enviar) y el .part, válido, se publica tal cual
+    assert servidor['peticiones'] == [('/b.zip', f'bytes={len(datos)}-')]
+    assert open(destino, 'rb').read() == datos and archivo_en_mirror_local(destino)
+
+def test_descarga_rechaza_zip_con_crc_invalido(servidor, tmp_path):
+    datos = bytearray(_zip_estacion('ESP_CT_Barcelona'))
+    datos[1000] ^= 0xFF  # dentro de los datos del .epw: el CRC ya no cuadra
+    servidor['archivos']['/c.zip'] = bytes(datos)
+    destino = str(tmp_path / 'c.zip')
+
+    assert not descargar_reanudable(servidor['base'] + '/c.zip', destino, reintentos=2)
+    assert len(servidor['peticiones']) == 2
+    assert not os.path.exists(destino) and not os.path.exists(destino + '.part')
+
+def test_espejar_paises_concurrencia_acotada_y_conversion(servidor, tmp_path, monkeypatch):
+    nombres = [f"XXX_E{i}.AP.{i:06d}_TMYx.zip" for i in range(8)]
+    enlaces = ''.join(f'<a href="{n}">{n}</a>' for n in nombres)
+    servidor['archivos']['/WMO_Region_9/XXX_Pais/index.html'] = f"<html>{enlaces}</html>".encode()
+    for n in nombres:
+        servidor['archivos'][f'/WMO_Region_9/XXX_Pais/{n}'] = _zip_estacion(n)
+    servidor['demora'] = 0.05
+    monkeypatch.setattr(mirror_utils, 'ONEBUILDING_MAPPING',
+                        {'XXX_Pais': servidor['base'] + '/WMO_Region_9/XXX_Pais/index.html'})
+    conversiones = []
+    monkeypatch.setattr(mirror_utils, 'convertir_estacion',
+                        lambda url, mirror_dir: conversiones.append((time.time(), url)) or True)
+
+    ok, fallidas = espejar_paises(['XXX_Pais'], str(tmp_path), workers=2)
+    assert (ok, fallidas) == (8, [])
+    assert servidor['max_activas'] <= 2
+    assert sorted(u.split('/')[-1] for _, u in conversiones) == sorted(nombres)
+    # Cada estación se convierte al terminar su descarga, no todas al final
+    ultima_descarga = max(os.path.getmtime(tmp_path / 'WMO_Region_9' / 'XXX_Pais' / n) for n in nombres)
+    assert min(t for t, _ in conversiones) < ultima_descarga
@@ -0,0 +1,46 @@
+# test_model_cache.py
+import geometry_utils
+from geometry_utils import construir_modelo_nave, obtener_cascaron
+
+def _aislar(monkeypatch, tmp_path):
+    monkeypatch.setattr(geometry_utils, 'CACHE_MODELOS', tmp_path)
+    monkeypatch.setattr(geometry_utils, '_cascarones', geometry_utils.collections.OrderedDict())
+
+def test_cascaron_se_guarda_y_se_reutiliza(monkeypatch, tmp_path):
+    _aislar(monkeypatch, tmp_path)
+    planta = [(0, 0), (30, 0), (30, 60), (0, 60)]
+    m1 = obtener_cascaron(7.0, planta)
+    assert len(list(tmp_path.glob('cascaron_*.hbjson'))) == 1
+
+    # Sin caché en memoria se lee el HBJSON en vez de pasar por Dragonfly
+    geometry_utils._cascarones.clear()
+    monkeypatch.setattr(geometry_utils, '_construir_cascaron', lambda *a: (_ for _ in ()).throw(AssertionError))
+    m2 = obtener_cascaron(7.0, planta)
+    assert m2.rooms[0].volume == m1.rooms[0].volume
+    # Cada llamada entrega una copia: añadir domos no contamina la caché
+    assert m2 is not obtener_cascaron(7.0, planta)
+
+def test_cambio_de_sfr_solo_reemplaza_domos(monkeypatch, tmp_path):
+    _aislar(monkeypatch, tmp_path)
+    m1, techo1, firma1, _ = construir_modelo_nave(30, 60, 7.0, 0.03, 1.3, 2.5)
+    m2, techo2, firma2, layout = construir_modelo_nave(30, 60, 7.0, 0.06, 1.3, 2.5)
+    _, _, firma3, _ = construir_modelo_nave(30, 60, 7.0, 0.06, 1.3, 2.5)
+
+    assert len(list(tmp_path.glob('cascaron_*.hbjson'))) == 1
+    assert len(techo2.apertures) > len(techo1.apertures) > 0
+    assert firma1 != firma2 and firma2 == firma3
+    assert m2.check_all() == ''
+    # El layout devuelto es el de los domos del modelo (la simulación no lo recalcula)
+    assert len(layout['centros']) == len(techo2.apertures) and layout['altura'] == 7.0
+    assert sorted(round(a.center.x, 6) for a in techo2.apertures) == sorted(layout['centros'][:, 0].round(6))
+
+def test_cascaron_concurrente_sin_archivos_a_medias(monkeypatch, tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    _aislar(monkeypatch, tmp_path)
+    plantas = [[(0, 0), (20 + i, 0), (20 + i, 40), (0, 40)] for i in range(3)] * 4
+    with ThreadPoolExecutor(6) as pool:
+        modelos = list(pool.map(lambda p: obtener_cascaron(6.0, p), plantas))
+    assert all(m.rooms for m in modelos)
+    assert len(geometry_utils._cascarones) == 3
+    # Solo quedan los HBJSON definitivos, sin temporales
+    assert sorted(p.suffix for p in tmp_path.iterdir()) == ['.hbjson'] * 3
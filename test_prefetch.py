@@ -0,0 +1,62 @@
+# test_prefetch.py
+import time
+
+import prefetch_utils
+from prefetch_utils import PrefetchClima
+
+def _simular_descargas(monkeypatch, demora=0.2):
+    llamadas, abortadas, cache = [], [], {}
+
+    def obtener_falso(url, cancelado=None):
+        if url in cache:
+            return cache[url]
+        llamadas.append(url)
+        fin = time.time() + demora
+        while time.time() < fin:
+            if cancelado and cancelado():
+                abortadas.append(url)
+                return None
+            time.sleep(0.01)
+        cache[url] = {'metadata': {'url': url}}
+        return cache[url]
+
+    monkeypatch.setattr(prefetch_utils, 'obtener_clima', obtener_falso)
+    monkeypatch.setattr(prefetch_utils, 'clima_en_cache', lambda url: url in cache)
+    return llamadas, abortadas
+
+def test_precarga_compartida_entre_sesiones(monkeypatch):
+    llamadas, _ = _simular_descargas(monkeypatch)
+    a, b = PrefetchClima(k=2), PrefetchClima(k=2)
+    a.programar(['u1', 'u2', 'u3'])
+    b.programar(['u1'])
+    assert a.obtener('u1')['metadata']['url'] == 'u1'
+    assert b.obtener('u1')['metadata']['url'] == 'u1'
+    assert llamadas.count('u1') == 1 and 'u3' not in llamadas
+
+def test_cambio_de_ubicacion_cancela(monkeypatch):
+    llamadas, abortadas = _simular_descargas(monkeypatch, demora=2.0)
+    sesion = PrefetchClima(k=3)
+    sesion.programar(['lejos1', 'lejos2', 'lejos3'])
+    time.sleep(0.05)
+    sesion.programar(['cerca'])
+    inicio = time.time()
+    while len(abortadas) < len(set(llamadas) - {'cerca'}) and time.time() - inicio < 1.0:
+        time.sleep(0.01)
+    assert set(abortadas) == set(llamadas) - {'cerca'}
+    assert sesion.pendientes() == ['cerca']
+    sesion.cancelar()
+
+def test_sesion_cerrada_libera_sus_precargas(monkeypatch):
+    import gc
+    llamadas, abortadas = _simular_descargas(monkeypatch, demora=2.0)
+    sesion = PrefetchClima(k=2)
+    sesion.programar(['abandonada1', 'abandonada2'])
+    time.sleep(0.05)
+    # La sesión se cierra sin llamar a cancelar()
+    del sesion
+    gc.collect()
+    assert not {'abandonada1', 'abandonada2'} & set(prefetch_utils._TAREAS)
+    inicio = time.time()
+    while len(abortadas) < len(llamadas) and time.time() - inicio < 1.0:
+        time.sleep(0.01)
+    assert set(abortadas) == set(llamadas)
@@ -0,0 +1,36 @@
+# test_psychro.py
+import numpy as np
+
+from psychro_utils import CALOR, CONFORT, FRIO, analisis_psicrometrico, media_exterior_predominante
+
+def test_estado_de_referencia_ashrae():
+    # 25 °C y 50% a nivel del mar: W = 9.88 g/kg, rocío 13.9 °C, bulbo húmedo 17.9 °C, h = 50.3 kJ/kg
+    r = analisis_psicrometrico(np.full(48, 25.0), np.full(48, 50.0))
+    assert abs(r['razon_humedad'][0] - 0.00988) < 5e-5
+    assert abs(r['punto_rocio'][0] - 13.9) < 0.1
+    assert abs(r['bulbo_humedo'][0] - 17.9) < 0.1
+    assert abs(r['entalpia'][0] - 50.3) < 0.2
+
+def test_bajo_cero_y_saturado():
+    r = analisis_psicrometrico(np.array([-10.0, 20.0] * 24), np.array([80.0, 100.0] * 24))
+    assert r['punto_rocio'][0] < r['bulbo_humedo'][0] < -10.0
+    assert abs(r['bulbo_humedo'][1] - 20.0) < 0.01 and abs(r['punto_rocio'][1] - 20.0) < 0.1
+
+def test_ano_completo_carta_y_horas():
+    rng = np.random.default_rng(1)
+    t = 15 + 10 * np.sin(np.arange(8760) / 8760 * 2 * np.pi) + 5 * rng.standard_normal(8760)
+    hr = rng.uniform(20, 100, 8760)
+    r = analisis_psicrometrico(t, hr, elevacion_m=1800)
+    assert r['carta'].sum() == 8760
+    assert r['horas_frio'] == int((t > 24).sum())
+    assert r['horas_deshumidificacion'] == int((r['razon_humedad'] > 0.012).sum())
+    assert r['horas_confort'] + r['horas_disconfort_calor'] + r['horas_disconfort_frio'] == 8760
+    assert set(np.unique(r['confort'])) <= {FRIO, CONFORT, CALOR}
+    assert np.all(r['bulbo_humedo'] <= t + 1e-6) and np.all(r['punto_rocio'] <= r['bulbo_humedo'] + 0.1)
+
+def test_media_predominante_usa_dias_previos():
+    t = np.repeat(np.r_[np.full(364, 10.0), 30.0], 24)
+    tpma = media_exterior_predominante(t)
+    # El 31 de diciembre caluroso pesa al máximo en la media del 1 de enero (año cíclico)
+    assert tpma[0] > tpma[24] > 10.0
+    assert abs(tpma[-1] - 10.0) < 1e-9
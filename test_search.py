@@ -0,0 +1,73 @@
+# test_search.py
+import time
+
+from search_utils import IndiceBusqueda, construir_indice, plegar
+from weather_utils import ONEBUILDING_MAPPING
+
+ESTACIONES_ESP = [
+    {'Estación': 'ESP_MD_Madrid-Barajas-Suarez.AP.082210_TMYx', 'City_Search': 'Madrid Barajas Suarez',
+     'URL_ZIP': 'https://x/ESP_MD_Madrid-Barajas.zip'},
+    {'Estación': 'ESP_CT_Barcelona.AP.081810_TMYx', 'City_Search': 'Barcelona',
+     'URL_ZIP': 'https://x/ESP_CT_Barcelona.zip'},
+    {'Estación': 'ESP_AN_Malaga.AP.084820_TMYx', 'City_Search': 'Malaga', 'URL_ZIP': 'https://x/ESP_AN_Malaga.zip'},
+]
+
+def test_plegar_unicode():
+    assert plegar("  Ciudad de MÉXICO ") == "ciudad de mexico"
+    assert plegar("Côte d'Ivoire") == "cote d ivoire"
+    assert plegar("São Tomé") == "sao tome"
+
+def test_alias_de_pais():
+    indice = construir_indice(ONEBUILDING_MAPPING)
+    assert indice.exacto("España", tipo='pais')['clave'] == 'ESP_Spain'
+    assert indice.exacto("Estados Unidos", tipo='pais')['clave'].startswith('USA_')
+    assert indice.exacto("Brasil", tipo='pais')['clave'] == 'BRA_Brazil'
+    # La coincidencia por subcadena elegía Nigeria para "Niger"
+    assert indice.buscar("Niger", limite=1, tipo='pais')[0][1]['clave'] == 'NER_Niger'
+    assert indice.buscar("Méxco", limite=1, tipo='pais')[0][1]['clave'] == 'MEX_Mexico'
+    # Nombres formales y locales que devuelven los geocodificadores
+    formales = {'Slovak Republic': 'SVK_Slovakia', 'Republic of Korea': 'KOR_South_Korea',
+                'Democratic Republic of the Congo': 'COD_Congo-Kinshasa', 'Ivory Coast': 'CIV_Cote_d-Ivoire',
+                'Schweiz': 'CHE_Switzerland', 'Suisse': 'CHE_Switzerland', 'Svizzera': 'CHE_Switzerland',
+                'Svizra': 'CHE_Switzerland'}
+    for nombre, clave in formales.items():
+        assert indice.exacto(nombre, tipo='pais')['clave'] == clave
+
+def test_resolver_pais_no_confunde_republicas():
+    from weather_utils import resolver_pais
+    # "Republic" solo puntuaba 0.52 contra "Czech Republic" y todos acababan en Chequia
+    assert resolver_pais("Kyrgyz Republic") == 'KGZ_Kyrgyzstan'
+    assert resolver_pais("Republic of India") == 'IND_India'
+    assert resolver_pais("Republic of the Congo") == 'COG_Congo-Brazzaville'
+    assert resolver_pais("Republic") is None
+    assert resolver_pais("Federal Republic of Germany") != 'CZE_Czechia'
+    assert resolver_pais("Méxco") == 'MEX_Mexico'
+
+def test_busqueda_de_estaciones_rankeada():
+    indice = IndiceBusqueda()
+    indice.agregar_estaciones(ESTACIONES_ESP, 'ESP_Spain')
+    indice.agregar_estaciones(ESTACIONES_ESP, 'ESP_Spain')  # no duplica
+    assert len(indice) == 3
+
+    resultados = indice.buscar("madrid", tipo='estacion')
+    assert resultados[0][1]['URL_ZIP'].endswith('Madrid-Barajas.zip')
+    assert indice.buscar("Málaga")[0][1]['nombre'].startswith('ESP_AN_Malaga')
+    assert indice.buscar("barcelona", clave='FRA_France') == []
+
+def test_busqueda_bajo_un_milisegundo(monkeypatch):
+    import weather_utils
+    indice = construir_indice(ONEBUILDING_MAPPING)
+    estaciones = [{'Estación': f'XXX_{i}_Ciudad{i}.AP_TMYx', 'City_Search': f'Ciudad{i} Norte',
+                   'URL_ZIP': f'https://x/{i}.zip'} for i in range(20000)]
+    indice.agregar_estaciones(estaciones, 'MEX_Mexico')
+    monkeypatch.setattr(weather_utils, '_INDICE', indice)
+    # "ciudad" y "norte" aparecen en 20,000 términos: el presupuesto de postings acota el trabajo
+    assert weather_utils.buscar_estaciones_por_nombre("Ciudad123 Norte").iloc[0]['URL_ZIP'] == 'https://x/123.zip'
+
+    mejor = float('inf')
+    for _ in range(5):
+        inicio = time.perf_counter()
+        for _ in range(20):
+            weather_utils.buscar_estaciones_por_nombre("Ciudad Norte")
+        mejor = min(mejor, (time.perf_counter() - inicio) / 20)
+    assert mejor < 1e-3
@@ -0,0 +1,82 @@
+# test_startup.py
+"""Presupuesto de arranque: lo que la app importa antes del primer render debe ser ligero."""
+import ast
+import json
+import os
+import subprocess
+import sys
+
+AQUI = os.path.dirname(os.path.abspath(__file__))
+
+# Presupuestos del arranque en frío (medidos ~0.3 s y ~35 MB; holgura para CI lento)
+PRESUPUESTO_IMPORT_S = 1.0
+PRESUPUESTO_RSS_MB = 80
+
+# Solo se cargan en las pestañas que los usan
+MODULOS_PESADOS = ('honeybee', 'dragonfly', 'honeybee_vtk', 'honeybee_display', 'ladybug_display',
+                   'ladybug_vtk', 'vtk', 'ladybug', 'geopy', 'bs4', 'pandas', 'plotly', 'streamlit_vtkjs')
+
+# geometry_utils no lo importa app.py al arrancar, pero tampoco debe arrastrar Ladybug al importarse
+MODULOS_EXTRA = ('search_utils', 'geometry_utils')
+
+SONDA = """
+import json, resource, sys, time
+t = time.perf_counter()
+for modulo in __MODULOS__:
+    __import__(modulo)
+dt = time.perf_counter() - t
+
+def pico_rss_mb():
+    # VmHWM se reinicia en exec; ru_maxrss puede heredar el pico del proceso padre (pytest)
+    try:
+        with open('/proc/self/status') as f:
+            return next(int(l.split()[1]) for l in f if l.startswith('VmHWM')) / 1024
+    except (OSError, StopIteration):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+print(json.dumps({
+    'segundos': dt,
+    'rss_mb': pico_rss_mb(),
+    'cargados': sorted({m.split('.')[0] for m in sys.modules}),
+}))
+"""
+
+def _imports_nivel_superior_app():
+    with open(os.path.join(AQUI, 'app.py'), encoding='utf-8') as f:
+        arbol = ast.parse(f.read())
+    # Imports de nivel superior; los que viven dentro de las pestañas (with/if) son perezosos
+    nivel_superior = set()
+    for nodo in arbol.body:
+        if isinstance(nodo, ast.Import):
+            nivel_superior.update(a.name.split('.')[0] for a in nodo.names)
+        elif isinstance(nodo, ast.ImportFrom) and nodo.module:
+            nivel_superior.add(nodo.module.split('.')[0])
+    return nivel_superior
+
+def _modulos_locales_de_arranque():
+    """Módulos del repo que app.py importa al cargar (así cada import nuevo entra en el presupuesto)."""
+    locales = {m for m in _imports_nivel_superior_app() if os.path.exists(os.path.join(AQUI, m + '.py'))}
+    return sorted(locales | set(MODULOS_EXTRA))
+
+def _medir_arranque():
+    sonda = SONDA.replace('__MODULOS__', repr(_modulos_locales_de_arranque()))
+    salida = subprocess.run([sys.executable, '-c', sonda], cwd=AQUI, capture_output=True, text=True, check=True)
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+def test_modulos_locales_no_cargan_pilas_pesadas():
+    cargados = set(_medir_arranque()['cargados'])
+    assert not cargados.intersection(MODULOS_PESADOS)
+
+def test_presupuesto_de_arranque():
+    medida = _medir_arranque()
+    assert medida['segundos'] < PRESUPUESTO_IMPORT_S, medida['segundos']
+    assert medida['rss_mb'] < PRESUPUESTO_RSS_MB, medida['rss_mb']
+
+def test_sonda_cubre_los_imports_locales_de_app():
+    assert {'weather_utils', 'prefetch_utils', 'store_utils'} <= set(_modulos_locales_de_arranque())
+
+def test_app_no_importa_pilas_pesadas_al_cargar():
+    nivel_superior = _imports_nivel_superior_app()
+    assert 'geometry_utils' not in nivel_superior
+    # pandas queda fuera: streamlit ya lo importa al arrancar
+    assert not nivel_superior.intersection(set(MODULOS_PESADOS) - {'pandas'})
@@ -0,0 +1,67 @@
+# test_store.py
+import gc
+
+import numpy as np
+
+import weather_utils
+from store_utils import AlmacenClima
+from weather_utils import VARIABLES_CLIMA, guardar_clima_compacto, ruta_clima_cache
+
+def _clima_en_disco(monkeypatch, tmp_path, urls):
+    monkeypatch.setattr(weather_utils, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(weather_utils, 'MIRROR_DIR', str(tmp_path / 'mirror'))
+    for i, url in enumerate(urls):
+        data = {k: np.full(8760, float(i)) for k in VARIABLES_CLIMA}
+        data['metadata'] = {'ciudad': f"Ciudad {i}"}
+        guardar_clima_compacto(data, ruta_clima_cache(url))
+
+def _sin_descarga(url):
+    raise AssertionError(f"no debería descargar {url}")
+
+def test_sesiones_comparten_una_copia(monkeypatch, tmp_path):
+    _clima_en_disco(monkeypatch, tmp_path, ['a.zip'])
+    almacen = AlmacenClima()
+    sesiones = [almacen.abrir('a.zip', obtener=_sin_descarga) for _ in range(100)]
+
+    stats = almacen.estadisticas()
+    assert stats['estaciones'] == 1 and stats['referencias'] == 100
+    # 100 usuarios, la memoria de una estación: todas las series son el mismo memmap
+    assert stats['bytes'] == len(VARIABLES_CLIMA) * 8760 * 4
+    assert all(s['temp_seca'] is sesiones[0]['temp_seca'] for s in sesiones)
+    assert isinstance(sesiones[0]['temp_seca'].base, np.memmap)
+    assert not sesiones[0]['temp_seca'].flags.writeable
+    assert sesiones[0]['metadata']['ciudad'] == 'Ciudad 0' and 'vel_viento' in sesiones[0]
+
+def test_referencias_y_desalojo(monkeypatch, tmp_path):
+    urls = [f"s{i}.zip" for i in range(4)]
+    _clima_en_disco(monkeypatch, tmp_path, urls)
+    almacen = AlmacenClima(max_sin_uso=1)
+    h0, h0b = almacen.abrir(urls[0], obtener=_sin_descarga), almacen.abrir(urls[0], obtener=_sin_descarga)
+    h0.liberar()
+    h0.liberar()  # liberar dos veces no descuenta dos referencias
+    assert almacen.estadisticas()['referencias'] == 1
+
+    # Una sesión que desaparece sin liberar devuelve su referencia al recolectarse
+    del h0b
+    gc.collect()
+    assert almacen.estadisticas()['referencias'] == 0
+
+    otros = [almacen.abrir(u, obtener=_sin_descarga) for u in urls[1:]]
+    for h in otros:
+        h.liberar()
+    # Solo sobrevive la estación sin uso más reciente
+    assert almacen.estadisticas() == {'estaciones': 1, 'referencias': 0, 'bytes': len(VARIABLES_CLIMA) * 8760 * 4}
+
+def test_descarga_si_no_esta_en_disco(monkeypatch, tmp_path):
+    _clima_en_disco(monkeypatch, tmp_path, [])
+    llamadas = []
+
+    def obtener(url):
+        llamadas.append(url)
+        _clima_en_disco(monkeypatch, tmp_path, [url])
+        return {'metadata': {}}
+
+    almacen = AlmacenClima()
+    assert almacen.abrir('nueva.zip', obtener=lambda url: None) is None
+    h1, h2 = almacen.abrir('nueva.zip', obtener=obtener), almacen.abrir('nueva.zip', obtener=obtener)
+    assert llamadas == ['nueva.zip'] and h1['temp_seca'] is h2['temp_seca']
@@ -1,20 +1,22 @@
 
 import json
-import requests
 import os
 import zipfile
 import urllib.request
-from geopy.distance import geodesic
-from geopy.geocoders import Nominatim, Photon
-import pandas as pd
-from ladybug.epw import EPW
 import shutil
 import tempfile
-from bs4 import BeautifulSoup
 import urllib.parse
 import re
 import random
 import time
+import hashlib
+import functools
+import threading
+import numpy as np
+from search_utils import construir_indice
+
+# geopy, requests, bs4, pandas y ladybug se importan dentro de cada función: este módulo se
+# carga al arrancar la app y la mayoría de las sesiones no los necesita (ver test_startup.py).
 
 # Load mapping of countries to OneBuilding URLs
 try:
@@ -23,8 +25,92 @@ try:
 except FileNotFoundError:
     ONEBUILDING_MAPPING = {}
 
+_INDICE = None
+_INDICE_LOCK = threading.Lock()
+
+# Espejo local de OneBuilding (ver mirror_utils.py). Replica la estructura de rutas del sitio.
+MIRROR_DIR = os.environ.get("SKYCALC_MIRROR", os.path.join("data", "mirror"))
+
+# Estaciones espejadas más lejanas no se ofrecen como cercanas; si no hay top_n dentro del
+# radio, el sitio está fuera de la cobertura del espejo y se recurre a la geocodificación en línea
+RADIO_ESPEJO_KM = float(os.environ.get("SKYCALC_RADIO_ESPEJO_KM", 300))
+
+# Caché local de climas ya procesados (mismo formato compacto que el espejo)
+CACHE_DIR = os.environ.get("SKYCALC_CACHE", os.path.join("data", "clima_cache"))
+
+# Formato compacto de clima: una matriz float32 (variables x horas) en .npy + metadatos en .json
+FORMATO_CLIMA_VERSION = 2
+VARIABLES_CLIMA = ('temp_seca', 'rad_directa', 'rad_dif', 'hum_relativa', 'vel_viento', 'dir_viento', 'nubes',
+                   'ilum_global')
+
+def ruta_en_mirror(url, mirror_dir=None):
+    """Ruta local equivalente a una URL de OneBuilding dentro del espejo."""
+    ruta_url = urllib.parse.unquote(urllib.parse.urlparse(url).path).lstrip('/')
+    return os.path.join(mirror_dir or MIRROR_DIR, *ruta_url.split('/'))
+
+def escribir_sidecar(path):
+    """Registra el checksum de un archivo completo del espejo en <path>.sha256."""
+    digest = sha256_archivo(path)
+    with open(path + '.sha256', 'w') as f:
+        f.write(f"{digest} {os.path.getsize(path)}\n")
+    return digest
+
+def sha256_archivo(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+def archivo_en_mirror(url, mirror_dir=None):
+    """Devuelve la ruta del archivo espejado si existe y está completo según su sidecar; None en otro caso."""
+    path = ruta_en_mirror(url, mirror_dir)
+    try:
+        # El sidecar guarda "<sha256> <bytes>". Aquí solo se compara el tamaño (barato);
+        # el hash completo lo re-verifica la herramienta de espejo en cada pasada.
+        with open(path + '.sha256') as f:
+            _, tamano = f.read().split()
+        if os.path.getsize(path) != int(tamano):
+            return None
+    except (OSError, ValueError):
+        return None
+    return path
+
+def guardar_clima_compacto(data, ruta_base):
+    """Guarda el dict de procesar_datos_clima como <ruta_base>.npy + <ruta_base>.json."""
+    os.makedirs(os.path.dirname(ruta_base) or '.', exist_ok=True)
+    matriz = np.array([data[k] for k in VARIABLES_CLIMA], dtype=np.float32)
+    # Escritura atómica: el .json (que marca el clima como disponible) se publica al final
+    sufijo = f".{os.getpid()}_{threading.get_ident()}.tmp"
+    np.save(ruta_base + sufijo + '.npy', matriz)
+    os.replace(ruta_base + sufijo + '.npy', ruta_base + '.npy')
+    with open(ruta_base + sufijo, 'w') as f:
+        json.dump({'version': FORMATO_CLIMA_VERSION, 'variables': list(VARIABLES_CLIMA),
+                   'metadata': data['metadata']}, f)
+    os.replace(ruta_base + sufijo, ruta_base + '.json')
+
+def cargar_clima_compacto(ruta_base, mmap=False):
+    """Carga un clima compacto. Las series se devuelven como filas float32 (vistas de una sola matriz)."""
+    try:
+        with open(ruta_base + '.json') as f:
+            info = json.load(f)
+        if info.get('version') != FORMATO_CLIMA_VERSION:
+            return None
+        matriz = np.load(ruta_base + '.npy', mmap_mode='r' if mmap else None)
+    except (OSError, ValueError):
+        return None
+    data = {'metadata': info['metadata']}
+    for i, k in enumerate(info['variables']):
+        data[k] = matriz[i]
+    return data
+
+def ruta_clima_mirror(url_zip, mirror_dir=None):
+    """Ruta base del clima compacto que la herramienta de espejo genera junto a cada zip."""
+    return re.sub(r'\.zip$', '', ruta_en_mirror(url_zip, mirror_dir))
+
 def get_location_info(lat, lon):
     """Robust reverse geocoding to identify country and city."""
+    from geopy.geocoders import Nominatim, Photon
     user_agents = [f"skycalc_explorer_{random.randint(100, 999)}", "Mozilla/5.0", "SkyCalc/2.0"]
 
     # Try Photon first
@@ -56,6 +142,7 @@ def get_location_info(lat, lon):
 
 def geocode_name(name):
     """Geocodes a city/country name into coordinates."""
+    from geopy.geocoders import Nominatim, Photon
     user_agents = [f"skycalc_search_{random.randint(100, 999)}"]
     try:
         geolocator = Photon(user_agent=random.choice(user_agents))
@@ -75,22 +162,29 @@ def geocode_name(name):
 
     return None, None
 
-def normalize_text(text):
-    if not text: return ""
-    res = text.lower().replace('á', 'a').replace('é', 'e').replace('í', 'i').replace('ó', 'o').replace('ú', 'u').replace('ñ', 'n')
-    mappings = {
-        "espana": "spain",
-        "mexico": "mexico",
-        "estados unidos": "usa",
-        "united states": "usa",
-        "brasil": "brazil",
-        "costa rica": "costa_rica"
-    }
-    for k, v in mappings.items():
-        if k in res:
-            return v
-    return res
-
+def indice_busqueda():
+    """Índice de países (con alias ES/EN) y estaciones conocidas, compartido por el proceso."""
+    global _INDICE
+    with _INDICE_LOCK:
+        if _INDICE is None:
+            _INDICE = construir_indice(ONEBUILDING_MAPPING, MIRROR_DIR)
+        return _INDICE
+
+def resolver_pais(nombre):
+    """Clave de ONEBUILDING_MAPPING para un nombre de país en español, inglés o código ISO3."""
+    if not nombre:
+        return None
+    indice = indice_busqueda()
+    entrada = indice.exacto(nombre, tipo='pais')
+    if entrada is None:
+        # Todas las palabras deben coincidir: "Slovak Republic" no debe resolverse a "Czech Republic"
+        resultados = indice.buscar(nombre, limite=2, tipo='pais', minimo=0.5, todas_palabras=True)
+        # Empate entre dos países ("Republic" a secas): mejor ninguno que uno equivocado
+        ambiguo = len(resultados) > 1 and resultados[0][0] - resultados[1][0] < 0.05
+        entrada = resultados[0][1] if resultados and not ambiguo else None
+    return entrada['clave'] if entrada else None
+
+@functools.lru_cache(maxsize=None)
 def extract_city_from_filename(filename):
     name = filename.split('/')[-1].replace('.zip', '')
     name = re.sub(r'\.7\d{5}.*', '', name)
@@ -104,105 +198,196 @@ def extract_city_from_filename(filename):
         city = parts[0]
     return city.replace('.', ' ').replace('-', ' ')
 
-def obtener_estaciones_cercanas(lat, lon, top_n=5):
-    country, city_target = get_location_info(lat, lon)
-    if not country:
-        # Fallback default
-        country = "Mexico"
-
-    norm_country = normalize_text(country)
-    country_url = None
-    for name, url in ONEBUILDING_MAPPING.items():
-        if norm_country in normalize_text(name) or normalize_text(name) in norm_country:
-            country_url = url
-            break
-
-    if not country_url:
+def descargar_indice_pais(country_url):
+    """HTML del índice de un país: del espejo local si existe, si no de OneBuilding."""
+    import requests
+    local = archivo_en_mirror(country_url)
+    if local:
+        with open(local, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read()
+    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+    resp = requests.get(country_url, headers=headers, timeout=15)
+    if resp.status_code != 200:
+        return None
+    return resp.text
+
+def listar_estaciones(html, country_url):
+    """Extrae los zips TMYx (uno por estación) de la página índice de un país."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    links = soup.find_all('a', href=True)
+
+    estaciones = []
+    seen_base_names = set()
+
+    for link in links:
+        href = link['href']
+        if href.endswith('.zip') and 'TMYx' in href:
+            base_name = re.sub(r'\.\d{4}-\d{4}', '', href)
+            if base_name in seen_base_names: continue
+            seen_base_names.add(base_name)
+
+            full_url = urllib.parse.urljoin(country_url, href)
+            city_name = extract_city_from_filename(href)
+
+            estaciones.append({
+                'Estación': base_name.replace('.zip', '').split('/')[-1],
+                'URL_ZIP': full_url,
+                'City_Search': city_name
+            })
+    return estaciones
+
+def _estaciones_por_distancia(indice, lat, lon, top_n):
+    """Estaciones espejadas a menos de RADIO_ESPEJO_KM, por distancia geodésica (sin red)."""
+    import pandas as pd
+    from geopy.distance import geodesic
+
+    # Preselección por gran círculo; la distancia mostrada es la geodésica (WGS84)
+    filas = []
+    for _, e in indice.cercanas(lat, lon, limite=top_n * 3):
+        km = geodesic((lat, lon), (e['lat'], e['lon'])).km
+        if km > RADIO_ESPEJO_KM:
+            continue
+        filas.append({'Estación': e['nombre'], 'name': e['nombre'],
+                      'distancia_km': round(km, 2),
+                      'URL_ZIP': e['URL_ZIP'], 'lat': e['lat'], 'lon': e['lon']})
+    if not filas:
         return pd.DataFrame()
+    return pd.DataFrame(filas).sort_values('distancia_km').head(top_n)
 
-    try:
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-        resp = requests.get(country_url, headers=headers, timeout=15)
-        if resp.status_code != 200:
-            return pd.DataFrame()
-
-        soup = BeautifulSoup(resp.text, 'html.parser')
-        links = soup.find_all('a', href=True)
+def obtener_estaciones_cercanas(lat, lon, top_n=5):
+    import pandas as pd
+    from geopy.distance import geodesic
+    from geopy.geocoders import Photon
 
-        estaciones = []
-        seen_base_names = set()
+    # Con espejo, cada estación espejada ya tiene lat/lon del EPW: ranking local sin geocodificar
+    # si el espejo cubre el sitio (top_n estaciones dentro del radio)
+    indice = indice_busqueda()
+    locales = _estaciones_por_distancia(indice, lat, lon, top_n)
+    if len(locales) >= top_n:
+        return locales
 
-        for link in links:
-            href = link['href']
-            if href.endswith('.zip') and 'TMYx' in href:
-                base_name = re.sub(r'\.\d{4}-\d{4}', '', href)
-                if base_name in seen_base_names: continue
-                seen_base_names.add(base_name)
+    country, city_target = get_location_info(lat, lon)
+    if not country:
+        # Sin red no se adivina un país: solo las estaciones espejadas cercanas (o nada)
+        return locales
 
-                full_url = urllib.parse.urljoin(country_url, href)
-                city_name = extract_city_from_filename(href)
+    clave_pais = resolver_pais(country)
+    if not clave_pais:
+        return locales
+    country_url = ONEBUILDING_MAPPING[clave_pais]
 
-                estaciones.append({
-                    'Estación': base_name.replace('.zip', '').split('/')[-1],
-                    'URL_ZIP': full_url,
-                    'City_Search': city_name
-                })
+    try:
+        html = descargar_indice_pais(country_url)
+        if html is None:
+            return locales
 
+        estaciones = listar_estaciones(html, country_url)
         if not estaciones:
-            return pd.DataFrame()
+            return locales
 
-        df = pd.DataFrame(estaciones)
+        indice.agregar_estaciones(estaciones, clave_pais)
 
-        # Heuristic: Search for city in names or just geocode first few
+        # Candidatos: estaciones del país ordenadas por similitud con la ciudad detectada
         candidatos = []
         if city_target:
-            mask = df['City_Search'].str.contains(city_target, case=False, na=False)
-            candidatos = df[mask].head(10).to_dict('records')
+            candidatos = [e for _, e in indice.buscar(city_target, limite=10, tipo='estacion', clave=clave_pais, minimo=0.4)]
 
         if len(candidatos) < 3:
-            existing_urls = [c['URL_ZIP'] for c in candidatos]
-            for _, row in df.head(10).iterrows():
-                if row['URL_ZIP'] not in existing_urls:
-                    candidatos.append(row.to_dict())
+            existing_urls = {c['URL_ZIP'] for c in candidatos}
+            for est in estaciones[:10]:
+                if est['URL_ZIP'] not in existing_urls:
+                    candidatos.append(indice.exacto(est['Estación'], tipo='estacion') or est)
 
         geolocator = Photon(user_agent=f"skycalc_v{random.randint(100,999)}")
         verified_estaciones = []
 
         for cand in candidatos[:8]:
-            try:
-                query = f"{cand['City_Search']}, {country}"
-                loc = geolocator.geocode(query, timeout=5)
-                if loc:
-                    dist = geodesic((lat, lon), (loc.latitude, loc.longitude)).km
-                    verified_estaciones.append({
-                        'Estación': cand['Estación'],
-                        'name': cand['Estación'],
-                        'distancia_km': round(dist, 2),
-                        'URL_ZIP': cand['URL_ZIP'],
-                        'lat': loc.latitude,
-                        'lon': loc.longitude
-                    })
-                time.sleep(0.5)
-            except:
-                continue
+            nombre = cand.get('nombre') or cand['Estación']
+            # Coordenadas ya conocidas: del EPW espejado o de una geocodificación anterior
+            coords = None
+            # mmap: solo se leen los metadatos, no la matriz horaria
+            clima_local = cargar_clima_compacto(ruta_clima_mirror(cand['URL_ZIP']), mmap=True)
+            if clima_local:
+                coords = (clima_local['metadata']['lat'], clima_local['metadata']['lon'])
+            elif cand.get('lat') is not None:
+                coords = (cand['lat'], cand['lon'])
+            if coords is None:
+                try:
+                    query = f"{extract_city_from_filename(cand['URL_ZIP'])}, {country}"
+                    loc = geolocator.geocode(query, timeout=5)
+                    time.sleep(0.5)
+                    if not loc:
+                        continue
+                    coords = (loc.latitude, loc.longitude)
+                except:
+                    continue
+            indice.registrar_coordenadas(cand['URL_ZIP'], *coords)
+            verified_estaciones.append({
+                'Estación': nombre,
+                'name': nombre,
+                'distancia_km': round(geodesic((lat, lon), coords).km, 2),
+                'URL_ZIP': cand['URL_ZIP'],
+                'lat': coords[0],
+                'lon': coords[1]
+            })
 
         if verified_estaciones:
             return pd.DataFrame(verified_estaciones).sort_values('distancia_km').head(top_n)
 
-        return pd.DataFrame()
+        return locales
 
     except Exception as e:
         print(f"Error: {e}")
+        return locales
+
+def buscar_estaciones_por_nombre(consulta, top_n=5):
+    """Estaciones indexadas cuyo nombre coincide con la consulta, ordenadas por similitud.
+
+    No geocodifica: las distancias se miden desde la primera coincidencia con coordenadas
+    conocidas. Devuelve un DataFrame vacío si la consulta no corresponde a ninguna estación.
+    """
+    import pandas as pd
+    from geopy.distance import geodesic
+
+    indice = indice_busqueda()
+    # "Madrid, España": si la última parte es un país conocido, se usa como filtro
+    clave = None
+    partes = [p.strip() for p in consulta.split(',')]
+    if len(partes) > 1:
+        pais = indice.exacto(partes[-1], tipo='pais')
+        if pais:
+            clave, consulta = pais['clave'], ', '.join(partes[:-1])
+    resultados = indice.buscar(consulta, limite=top_n, tipo='estacion', clave=clave, minimo=0.5)
+    if not resultados:
         return pd.DataFrame()
-
-def descargar_y_extraer_epw(url_zip):
+    filas = [{'Estación': e['nombre'], 'name': e['nombre'], 'URL_ZIP': e['URL_ZIP'],
+              'lat': e.get('lat'), 'lon': e.get('lon'), 'similitud': round(p, 2)} for p, e in resultados]
+    origen = next(((f['lat'], f['lon']) for f in filas if f['lat'] is not None), None)
+    for f in filas:
+        if origen and f['lat'] is not None:
+            f['distancia_km'] = round(geodesic(origen, (f['lat'], f['lon'])).km, 2)
+    return pd.DataFrame(filas)
+
+def descargar_y_extraer_epw(url_zip, cancelado=None):
+    """Descarga el zip (o lo toma del espejo) y copia su .epw a un temporal.
+
+    `cancelado` es un callable opcional que se consulta entre bloques de descarga; si devuelve
+    True la descarga se abandona y la función devuelve None.
+    """
     temp_dir = tempfile.mkdtemp(prefix="epw_")
-    zip_fn = os.path.join(temp_dir, "clima.zip")
+    # Si el zip está en el espejo local se extrae directamente de ahí
+    zip_fn = archivo_en_mirror(url_zip)
     try:
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        req = urllib.request.Request(url_zip, headers=headers)
-        with urllib.request.urlopen(req) as response, open(zip_fn, 'wb') as out_file:
-            shutil.copyfileobj(response, out_file)
+        if zip_fn is None:
+            zip_fn = os.path.join(temp_dir, "clima.zip")
+            headers = {'User-Agent': 'Mozilla/5.0'}
+            req = urllib.request.Request(url_zip, headers=headers)
+            with urllib.request.urlopen(req, timeout=30) as response, open(zip_fn, 'wb') as out_file:
+                for bloque in iter(lambda: response.read(1 << 16), b''):
+                    if cancelado and cancelado():
+                        return None
+                    out_file.write(bloque)
         
         with zipfile.ZipFile(zip_fn, 'r') as z:
             z.extractall(temp_dir)
@@ -242,8 +427,49 @@ def procesar_datos_clima(epw_path):
             'vel_viento': epw.wind_speed.values,
             'dir_viento': epw.wind_direction.values,
             # 🟢 NUEVO DATO: Nubosidad (0 a 10)
-            'nubes': epw.total_sky_cover.values
+            'nubes': epw.total_sky_cover.values,
+            # Iluminancia global horizontal exterior (lux) para la malla de iluminación interior
+            'ilum_global': epw.global_horizontal_illuminance.values
         }
     except Exception as e:
         print(f"Error con Ladybug EPW: {e}")
         return None
+
+def ruta_clima_cache(url_zip):
+    """Ruta base del clima compacto en la caché local (estaciones descargadas fuera del espejo)."""
+    return os.path.join(CACHE_DIR, hashlib.sha1(url_zip.encode('utf-8')).hexdigest()[:16])
+
+def ruta_clima_compacto(url_zip):
+    """Ruta base del clima compacto vigente de la estación (espejo primero, luego caché) o None."""
+    # mmap: solo lee la cabecera; además descarta cachés de una versión anterior del formato
+    for ruta_base in (ruta_clima_mirror(url_zip), ruta_clima_cache(url_zip)):
+        if cargar_clima_compacto(ruta_base, mmap=True) is not None:
+            return ruta_base
+    return None
+
+def clima_en_cache(url_zip):
+    """True si el clima de la estación ya está en el espejo o en la caché local (carga instantánea)."""
+    return ruta_clima_compacto(url_zip) is not None
+
+def obtener_clima(url_zip, cancelado=None):
+    """Clima listo para la app: del espejo o la caché compacta; si no, descarga, procesa y cachea el EPW."""
+    for ruta_base in (ruta_clima_mirror(url_zip), ruta_clima_cache(url_zip)):
+        data = cargar_clima_compacto(ruta_base)
+        if data:
+            return data
+    path = descargar_y_extraer_epw(url_zip, cancelado=cancelado)
+    if not path:
+        return None
+    try:
+        data = procesar_datos_clima(path)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    if not data:
+        return None
+    try:
+        guardar_clima_compacto(data, ruta_clima_cache(url_zip))
+        return cargar_clima_compacto(ruta_clima_cache(url_zip)) or data
+    except OSError as e:
+        print(f"Aviso: no se pudo cachear el clima ({e})")
+        return data